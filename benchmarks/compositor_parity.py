@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from benchmarks.synthetic_chat import SyntheticChatConfig, write_chat
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Render sample pages with every compositor, check that they '
+                                                     'match the Pillow pixels exactly and compare render times.')
+    arg_parser.add_argument('--messages', type=int, default=2000)
+    arg_parser.add_argument('--pages', type=int, default=20, help='number of sample pages to render')
+    arg_parser.add_argument('--chat', help='render pages of this export instead of a synthetic chat')
+    arg_parser.add_argument('--compositors', nargs='+', help='compositors to check (default: all)')
+    args = arg_parser.parse_args(argv)
+
+    from chat_parser.chat_parser import parse_chat
+    from whatsapp_page.page_compositor import COMPOSITORS
+    from whatsapp_page.whatsapp_paginator import WhatsappPaginator
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        chat_file_name = args.chat
+        if chat_file_name is None:
+            chat_file_name = os.path.join(work_dir, 'chat.txt')
+            write_chat(chat_file_name, SyntheticChatConfig(args.messages))
+        with open(chat_file_name, encoding='utf-8-sig') as chat_file:
+            all_texts = parse_chat(chat_file)
+    page_plans = WhatsappPaginator.plan_pages(all_texts)[:args.pages]
+
+    def render(compositor: str) -> List[bytes]:
+        return [WhatsappPaginator.build_page(all_texts, page_plan, compositor).render_page().tobytes()
+                for page_plan in page_plans]
+
+    expected = render('pillow')
+    mismatches = 0
+    print(f'{"compositor":>12} {"ms/page":>10} {"pages":>8} {"mismatched":>12}')
+    for name in args.compositors or COMPOSITORS:
+        render(name)
+        start = time.perf_counter()
+        pages = render(name)
+        elapsed = time.perf_counter() - start
+        # RGBA bytes, so the alpha the page keeps around pointers is compared too
+        mismatched = [page_plan.page_number for page_plan, page, expected_page in zip(page_plans, pages, expected)
+                      if page != expected_page]
+        mismatches += len(mismatched)
+        print(f'{name:>12} {1000 * elapsed / len(pages):>10.1f} {len(pages):>8} {len(mismatched):>12}')
+        if mismatched:
+            print(f'{"":>12} pages differing from pillow: {", ".join(map(str, mismatched))}')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
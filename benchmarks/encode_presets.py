@@ -0,0 +1,43 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from benchmarks.synthetic_chat import SyntheticChatConfig, write_chat
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Compare encode time and file size of the page output presets.')
+    arg_parser.add_argument('--messages', type=int, default=500)
+    arg_parser.add_argument('--pages', type=int, default=5, help='number of sample pages to encode')
+    arg_parser.add_argument('--repeat', type=int, default=1, help='encodes per page and preset')
+    arg_parser.add_argument('--presets', nargs='+', help='presets to measure (default: all)')
+    args = arg_parser.parse_args(argv)
+
+    from chat_parser.chat_parser import parse_chat
+    from whatsapp_page.output_format import OUTPUT_FORMATS
+    from whatsapp_page.whatsapp_paginator import WhatsappPaginator
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        chat_file_name = os.path.join(work_dir, 'chat.txt')
+        write_chat(chat_file_name, SyntheticChatConfig(args.messages))
+        with open(chat_file_name, encoding='utf-8') as chat_file:
+            all_texts = parse_chat(chat_file)
+    page_plans = WhatsappPaginator.plan_pages(all_texts)[:args.pages]
+    images = [WhatsappPaginator.build_page(all_texts, page_plan).render_page() for page_plan in page_plans]
+
+    print(f'{"preset":>14} {"ms/page":>10} {"KB/page":>10}')
+    for name in args.presets or OUTPUT_FORMATS:
+        output_format = OUTPUT_FORMATS[name]
+        total_bytes, start = 0, time.perf_counter()
+        for _ in range(args.repeat):
+            total_bytes = sum(len(output_format.encode(img)) for img in images)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f'{name:>14} {1000 * elapsed / len(images):>10.1f} {total_bytes / 1024 / len(images):>10.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Run in a fresh interpreter: imports the package, then reports which caches were filled while importing
+_CHILD_CODE = '''
+import json
+import {module}
+from instrumentation.metrics import METRICS
+caches = METRICS.report()['caches']
+print(json.dumps({{name: stats['misses'] for name, stats in caches.items() if stats['misses']}}))
+'''
+# Caches that are filled by reading files from the resources folder
+_RESOURCE_CACHES: Tuple[str, ...] = ('resources.fonts', 'sprite_cache.load')
+
+
+def import_once(module: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    # Returns the cumulative import time of every module in microseconds and the caches filled at import
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD_CODE.format(module=module)],
+                               capture_output=True, text=True, check=True)
+    module_times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        module_times[name.strip()] = int(cumulative)
+    return module_times, json.loads(completed.stdout.splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Measure how long importing the package takes in a fresh '
+                                                     'process and check that no font or image is read at import.')
+    arg_parser.add_argument('--module', default='main', help='module to import')
+    arg_parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to import in; the median is used')
+    arg_parser.add_argument('--budget-ms', type=float, default=200.0,
+                            help='fail if the median import of the module takes longer')
+    arg_parser.add_argument('--top', type=int, default=15, help='number of slowest modules to list')
+    args = arg_parser.parse_args(argv)
+
+    runs = [import_once(args.module) for _ in range(args.runs)]
+    median_ms = {name: statistics.median(module_times.get(name, 0) for module_times, _ in runs) / 1000
+                 for name in runs[0][0]}
+    total_ms = median_ms[args.module]
+
+    print(f'{"module":<50} {"ms":>8}')
+    for name, elapsed in sorted(median_ms.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'{name:<50} {elapsed:>8.1f}')
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f'importing {args.module} took {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget')
+    loaded = {name: misses for name, misses in runs[0][1].items() if name in _RESOURCE_CACHES}
+    if loaded:
+        failures.append(f'resources were loaded at import: {loaded}')
+    for failure in failures:
+        print(failure)
+    if not failures:
+        print(f'importing {args.module} took {total_ms:.1f} ms, within the {args.budget_ms:.0f} ms budget')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.synthetic_chat import SyntheticChatConfig, write_chat
+
+DEFAULT_SIZES: List[int] = [1000, 10000, 100000]
+STAGES: List[str] = ['parse_chat', 'get_box_size', 'split_page', 'render_page', 'png_save']
+
+
+def _timed(stage_results: Dict[str, Dict[str, float]], stage: str, items: int, fn: Callable[[], object]) -> object:
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    stage_results[stage] = {'seconds': elapsed, 'items': items, 'throughput': items / elapsed if elapsed else 0.0}
+    return result
+
+
+def run_size(num_messages: int, config_overrides: Dict[str, float], render_pages: int) -> Dict[str, object]:
+    # Imported here so that the chat box caches belong to the benchmark process
+    from chat_parser.chat_parser import parse_chat
+    from whatsapp_page.elements.chat_box.chat_box import ChatBox
+    from whatsapp_page.whatsapp_paginator import WhatsappPaginator
+
+    stage_results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        chat_file_name = os.path.join(work_dir, 'chat.txt')
+        write_chat(chat_file_name, SyntheticChatConfig(num_messages, **config_overrides))
+
+        ChatBox.clear_caches()
+        with open(chat_file_name, encoding='utf-8') as chat_file:
+            all_texts = _timed(stage_results, 'parse_chat', num_messages, lambda: parse_chat(chat_file))
+
+        messages = [all_texts.get_message(idx) for idx in range(len(all_texts))]
+        ChatBox.clear_caches()
+        _timed(stage_results, 'get_box_size', len(messages), lambda: [ChatBox.get_box_size(m) for m in messages])
+
+        page_plans = _timed(stage_results, 'split_page', len(all_texts),
+                            lambda: WhatsappPaginator.plan_pages(all_texts))
+
+        pages = [WhatsappPaginator.build_page(all_texts, page_plan) for page_plan in page_plans[:render_pages]]
+        _timed(stage_results, 'render_page', len(pages), lambda: [page.render_page() for page in pages])
+        _timed(stage_results, 'png_save', len(pages),
+               lambda: [page.save(os.path.join(work_dir, f'{idx}.png')) for idx, page in enumerate(pages)])
+
+    return {
+        'messages': num_messages,
+        'chat_boxes': len(all_texts),
+        'pages': len(page_plans),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': stage_results,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    regressions = []
+    for size, result in results.items():
+        if size not in baseline:
+            continue
+        for stage, stage_result in result['stages'].items():
+            expected = baseline[size]['stages'].get(stage, {}).get('throughput')
+            if expected and stage_result['throughput'] < expected * (1 - tolerance):
+                regressions.append(f'{size} messages / {stage}: {stage_result["throughput"]:.1f}/s '
+                                   f'vs baseline {expected:.1f}/s')
+        expected_rss = baseline[size].get('peak_rss_mb')
+        if expected_rss and result['peak_rss_mb'] > expected_rss * (1 + tolerance):
+            regressions.append(f'{size} messages / peak RSS: {result["peak_rss_mb"]:.0f} MB '
+                               f'vs baseline {expected_rss:.0f} MB')
+    return regressions
+
+
+def print_report(results: Dict[str, Dict]) -> None:
+    print(f'{"messages":>10} {"stage":>14} {"seconds":>10} {"items/s":>12}')
+    for size, result in results.items():
+        for stage in STAGES:
+            stage_result = result['stages'][stage]
+            print(f'{size:>10} {stage:>14} {stage_result["seconds"]:>10.3f} {stage_result["throughput"]:>12.1f}')
+        print(f'{size:>10} {"peak RSS":>14} {result["peak_rss_mb"]:>9.0f}M {result["pages"]:>8} pages')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Time each stage of the chat export pipeline.')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--mean-words', type=float, default=12)
+    arg_parser.add_argument('--words-sigma', type=float, default=1.0)
+    arg_parser.add_argument('--multiline-ratio', type=float, default=0.1)
+    arg_parser.add_argument('--emoji-ratio', type=float, default=0.1)
+    arg_parser.add_argument('--days', type=int, default=365)
+    arg_parser.add_argument('--render-pages', type=int, default=20,
+                            help='number of pages rendered and encoded per size')
+    arg_parser.add_argument('--output', help='write the results as JSON to this file')
+    arg_parser.add_argument('--baseline', help='compare against results previously written with --output')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='allowed relative slowdown (or RSS growth) before a stage counts as a regression')
+    args = arg_parser.parse_args(argv)
+
+    config_overrides = {'seed': args.seed, 'mean_words': args.mean_words, 'words_sigma': args.words_sigma,
+                        'multiline_ratio': args.multiline_ratio, 'emoji_ratio': args.emoji_ratio, 'days': args.days}
+    results = {}
+    for size in args.sizes:
+        # A fresh process per size keeps the peak RSS figures independent of each other
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[str(size)] = executor.submit(run_size, size, config_overrides, args.render_pages).result()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import datetime
+import random
+from typing import Iterator, Sequence
+
+import constants
+
+_WORDS: Sequence[str] = ('ok', 'sure', 'hello', 'there', 'how', 'are', 'you', 'doing', 'today', 'tomorrow', 'lunch',
+                         'meeting', 'invoice', 'call', 'me', 'when', 'free', 'haha', 'yes', 'no', 'maybe', 'later',
+                         'definitely', 'weekend', 'pictures', 'message', 'sorry', 'running', 'late', 'traffic')
+_EMOJIS: Sequence[str] = ('😀', '😂', '❤', '👍', '🎉', '🙏', '😅', '🔥')
+_SYSTEM_MESSAGE: str = 'Messages and calls are end-to-end encrypted. No one outside of this chat, not even ' \
+                       'WhatsApp, can read or listen to them. Tap to learn more.'
+
+
+class SyntheticChatConfig:
+    def __init__(self, num_messages: int, seed: int = 0, mean_words: float = 12, words_sigma: float = 1.0,
+                 multiline_ratio: float = 0.1, emoji_ratio: float = 0.1, days: int = 365,
+                 start_date: datetime.datetime = datetime.datetime(2019, 1, 1, 8, 0),
+                 senders: Sequence[str] = tuple(constants.PARTICIPANTS)) -> None:
+        self.num_messages = num_messages
+        self.seed = seed
+        self.mean_words = mean_words
+        self.words_sigma = words_sigma
+        self.multiline_ratio = multiline_ratio
+        self.emoji_ratio = emoji_ratio
+        self.days = days
+        self.start_date = start_date
+        self.senders = senders
+
+
+def generate_chat_lines(config: SyntheticChatConfig) -> Iterator[str]:
+    rng = random.Random(config.seed)
+    senders = config.senders
+    # Spread messages evenly over the requested days, with jitter so timestamps stay monotonic
+    step = datetime.timedelta(days=config.days) / max(config.num_messages, 1)
+    sent_time = config.start_date
+    yield f'{sent_time:%d/%m/%Y, %H:%M} - {_SYSTEM_MESSAGE}\n'
+    for _ in range(config.num_messages):
+        sent_time += step * rng.uniform(0.5, 1.5)
+        words = [rng.choice(_WORDS) for _ in range(max(1, int(rng.lognormvariate(0, config.words_sigma) *
+                                                               config.mean_words)))]
+        if rng.random() < config.emoji_ratio:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(_EMOJIS))
+        if rng.random() < config.multiline_ratio:
+            for _ in range(rng.randint(1, 4)):
+                words.insert(rng.randrange(len(words) + 1), '\n')
+        message = ' '.join(words).replace(' \n ', '\n')
+        yield f'{sent_time:%d/%m/%Y, %H:%M} - {rng.choice(senders)}: {message}\n'
+
+
+def write_chat(file_name: str, config: SyntheticChatConfig) -> None:
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.writelines(generate_chat_lines(config))
@@ -0,0 +1,75 @@
+import argparse
+import math
+import random
+import sys
+import textwrap
+import warnings
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+from PIL.ImageFont import FreeTypeFont
+
+_ASCII_WORDS = ('ok', 'sure', 'hello', 'there', 'how', 'are', 'you', 'doing', 'today', 'lunch', 'meeting', 'invoice',
+                'call', 'me', 'when', 'free', 'haha', 'definitely', 'weekend', 'pictures', 'sorry', 'traffic', 'x')
+_EMOJIS = ('😀', '😂', '❤', '👍', '🎉', '🙏', '😅', '🔥')
+_CJK_WORDS = ('你好', '明天', '会议', '发票', 'こんにちは', 'ありがとう', '今日', '안녕하세요', '감사합니다')
+_TEXT_KINDS = ('ascii', 'emoji', 'cjk', 'mixed')
+
+
+def random_text(rng: random.Random, kind: str) -> str:
+    vocabulary = {'ascii': _ASCII_WORDS, 'emoji': _ASCII_WORDS + _EMOJIS, 'cjk': _CJK_WORDS,
+                  'mixed': _ASCII_WORDS + _EMOJIS + _CJK_WORDS}[kind]
+    words = [rng.choice(vocabulary) for _ in range(max(1, int(rng.lognormvariate(0, 1.2) * 12)))]
+    for _ in range(rng.choice((0, 0, 1, 3))):
+        words.insert(rng.randrange(len(words) + 1), '\n')
+    # Long unbroken runs exercise wrapping in the middle of a word
+    if rng.random() < 0.1:
+        words.append(rng.choice(vocabulary) * rng.randint(20, 80))
+    return ' '.join(words).replace(' \n ', '\n')
+
+
+def reference_box_size(text_msg: str, font: FreeTypeFont, max_width: int, letters_per_line: int,
+                       spacing: int) -> Tuple[float, float]:
+    # The sizes as the chat box measured them with `ImageDraw.multiline_textsize` before `TextMetrics`
+    total_lines = 0
+    for line in text_msg.splitlines(keepends=False):
+        total_lines += len(textwrap.wrap(line, width=letters_per_line, replace_whitespace=False))
+    draw = ImageDraw.Draw(Image.new('RGB', (3000, 3000)))
+    with warnings.catch_warnings():
+        # Deprecated since Pillow 9.2, but it is the measurement the sizes have to keep matching
+        warnings.simplefilter('ignore', DeprecationWarning)
+        w, h = draw.multiline_textsize(text=text_msg, font=font, spacing=spacing)
+    if w > max_width:
+        width_bars = math.ceil(w / max_width)
+        return max_width, (h + 2) * (width_bars + 1) + (total_lines * spacing) + 10
+    return w, h + (total_lines * spacing) + 10
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Check that the chat box sizes measured through TextMetrics '
+                                                     'match the ImageDraw.multiline_textsize ones exactly.')
+    arg_parser.add_argument('--texts', type=int, default=3000, help='random texts to measure')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args(argv)
+
+    from whatsapp_page.elements.chat_box.chat_box import ChatBox
+
+    rng = random.Random(args.seed)
+    font = ChatBox.get_message_font()
+    max_width = ChatBox.get_max_box_width()
+    mismatches: List[Tuple[str, Tuple[float, float], Tuple[float, float]]] = []
+    for idx in range(args.texts):
+        text = random_text(rng, _TEXT_KINDS[idx % len(_TEXT_KINDS)])
+        expected = reference_box_size(text, font, max_width, ChatBox.LETTERS_PER_LINE, ChatBox._TEXT_SPACING)
+        measured = ChatBox.get_box_size(text)
+        if measured != expected:
+            mismatches.append((text, measured, expected))
+
+    for text, measured, expected in mismatches[:10]:
+        print(f'{text[:60]!r}: measured {measured}, expected {expected}')
+    print(f'{args.texts} texts, {len(mismatches)} mismatched')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
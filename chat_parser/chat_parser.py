@@ -0,0 +1,55 @@
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, List, Optional
+
+from tqdm import tqdm
+
+from chat_parser.chat_reader import read_chat
+from chat_parser.timestamps import TimestampParser
+from instrumentation.metrics import METRICS
+from models.chat_store import ChatStore
+from models.participants import Participant, ParticipantRegistry
+from whatsapp_page.elements.chat_box.chat_box import ChatBox
+from whatsapp_page.elements.page_elements import WhatsappPageElement
+
+
+@METRICS.timer('split')
+def split(message: str) -> List[str]:
+    return ChatBox.split_message(message, WhatsappPageElement.MAX_ELEMENT_HEIGHT)
+
+
+def add_new_text(all_texts: ChatStore, message: str, sent_time: datetime,
+                 sender: Participant, previous_sender: Participant) -> None:
+    all_texts.append(message, sent_time, sender, (sender == previous_sender), ChatBox.get_box_size(message))
+
+
+@METRICS.timer('parse_chat', log=True)
+def parse_chat(chat_file: Iterable[str], limit: int = float('inf'),
+               registry: Optional[ParticipantRegistry] = None,
+               timestamp_parser: Optional[TimestampParser] = None, all_texts: Optional[ChatStore] = None) -> ChatStore:
+    # Passing `all_texts` appends the parsed messages to an existing store (with its registry)
+    if all_texts is None:
+        all_texts = ChatStore(registry if registry is not None else ParticipantRegistry.default())
+    registry = all_texts.registry
+    previous_sender = all_texts.get_sender(len(all_texts) - 1) if len(all_texts) else None
+    parsed_texts = read_chat(chat_file, timestamp_parser, registry=registry)
+    if limit != float('inf'):
+        parsed_texts = islice(parsed_texts, limit)
+    for text in tqdm(parsed_texts, position=0, leave=True):
+        sent_time, sender, message = text.delivery_time, text.sender, text.message
+        METRICS.increment('messages_parsed')
+        all_texts.message_count += 1
+        estimated_size = ChatBox.get_box_size(message)
+        estimated_height = estimated_size[1]
+        if estimated_height > WhatsappPageElement.MAX_ELEMENT_HEIGHT:
+            messages = split(message)
+            METRICS.increment('messages_split')
+            for small_message in messages:
+                add_new_text(all_texts, small_message, sent_time, sender, previous_sender)
+                previous_sender = sender
+        else:
+            add_new_text(all_texts, message, sent_time, sender, previous_sender)
+
+        previous_sender = sender
+
+    return all_texts
@@ -0,0 +1,112 @@
+import re
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import constants
+from chat_parser.timestamps import TIMESTAMP_PATTERN, TimestampParser
+from models.participants import Participant, ParticipantRegistry
+from models.whatsapp_text import WhatsappText
+
+# Exports saved with a byte order mark have it in front of the first header
+_HEADER_REGEX = re.compile(r'\ufeff?(' + TIMESTAMP_PATTERN + r') - ')
+# Finds the headers in a whole export rather than in a single line
+_EXPORT_HEADER_REGEX = re.compile(r'^' + _HEADER_REGEX.pattern, re.MULTILINE)
+_SENDER_SEPARATOR: str = ': '
+# WhatsApp caps display names well below this; longer prefixes are system notices that contain ': '
+_MAX_SENDER_LENGTH: int = 64
+# System notices only contain ': ' inside quoted group names/descriptions, e.g. 'X created group "Trip: 2019"'
+_SYSTEM_NOTICE_QUOTES: str = '"\u201c\u201d'
+
+
+def discover_participants(chat_file: Iterable[str], main_participant: Optional[str] = None,
+                          registry: Optional[ParticipantRegistry] = None) -> ParticipantRegistry:
+    # A first pass over the export that registers every sender, in order of first appearance. An existing
+    # registry is extended instead, e.g. with the senders of newly exported messages
+    if registry is None:
+        registry = ParticipantRegistry(main_participant or constants.MAIN_PARTICIPANT)
+    for line in chat_file:
+        header = _HEADER_REGEX.match(line)
+        if header is not None:
+            sender = _split_sender(line, header.end())[0]
+            if sender is not None:
+                registry.register(sender)
+    registry.closed = True
+    return registry
+
+
+def _split_sender(line: str, body_start: int) -> Tuple[Optional[str], int]:
+    separator = line.find(_SENDER_SEPARATOR, body_start, body_start + _MAX_SENDER_LENGTH + len(_SENDER_SEPARATOR))
+    if separator < 0:
+        return None, body_start
+    sender = line[body_start:separator]
+    if any(quote in sender for quote in _SYSTEM_NOTICE_QUOTES):
+        return None, body_start
+    return sender, separator + len(_SENDER_SEPARATOR)
+
+
+def read_head(chat_text: str, messages: int) -> str:
+    # The start of an export holding its first `messages` messages (system notices aside). Only the headers
+    # up to there are looked at, so the cost does not grow with the rest of the export
+    seen = 0
+    for header in _EXPORT_HEADER_REGEX.finditer(chat_text):
+        line_end = chat_text.find('\n', header.end())
+        line = chat_text[header.start():line_end if line_end >= 0 else len(chat_text)]
+        if _split_sender(line, header.end() - header.start())[0] is None:
+            continue
+        if seen == messages:
+            return chat_text[:header.start()]
+        seen += 1
+    return chat_text
+
+
+def is_message_header(line: str) -> bool:
+    return _HEADER_REGEX.match(line) is not None
+
+
+def detect_timestamp_parser(chat_file: Iterator[str]) -> Tuple[TimestampParser, List[str]]:
+    # Reads ahead until enough headers are seen to detect the date order; the lines read are handed back
+    lines: List[str] = []
+    timestamps: List[str] = []
+    for line in chat_file:
+        lines.append(line)
+        header = _HEADER_REGEX.match(line)
+        if header is not None:
+            timestamps.append(header.group(1))
+            if len(timestamps) >= TimestampParser.SAMPLE_SIZE:
+                break
+    return TimestampParser.from_sample(timestamps), lines
+
+
+def read_chat(chat_file: Iterable[str], timestamp_parser: Optional[TimestampParser] = None,
+              registry: Optional[ParticipantRegistry] = None) -> Iterator[WhatsappText]:
+    # A message runs from its header line up to the next header line (or EOF). Headers without a
+    # known sender (system notices) close the previous message and are skipped.
+    registry = registry if registry is not None else ParticipantRegistry.default()
+    chat_file = iter(chat_file)
+    if timestamp_parser is None:
+        timestamp_parser, sample_lines = detect_timestamp_parser(chat_file)
+        chat_file = chain(sample_lines, chat_file)
+
+    sent_time: Optional[str] = None
+    sender: Optional[Participant] = None
+    message_lines: List[str] = []
+
+    for line in chat_file:
+        header = _HEADER_REGEX.match(line)
+        if header is None:
+            if sender is not None:
+                message_lines.append(line)
+            continue
+
+        if sender is not None:
+            yield WhatsappText(message=''.join(message_lines).rstrip(), delivery_time=timestamp_parser.parse(sent_time),
+                               sender=sender)
+
+        sent_time = header.group(1)
+        sender_name, body_start = _split_sender(line, header.end())
+        sender = registry.lookup(sender_name) if sender_name is not None else None
+        message_lines = [line[body_start:]] if sender is not None else []
+
+    if sender is not None:
+        yield WhatsappText(message=''.join(message_lines).rstrip(), delivery_time=timestamp_parser.parse(sent_time),
+                           sender=sender)
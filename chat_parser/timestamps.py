@@ -0,0 +1,95 @@
+import datetime
+import re
+from enum import Enum
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+# Covers 12h/24h clocks and 2/4-digit years, e.g. '15/05/2016, 15:50' or '5/15/16, 3:50 PM'
+TIMESTAMP_PATTERN: str = r'\d{1,2}/\d{1,2}/\d{2,4}, \d{1,2}:\d{2}(?:[ \u202f]?[AaPp]\.?[Mm]\.?)?'
+_TIMESTAMP_REGEX = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2,4}), (\d{1,2}):(\d{2})(?:[ \u202f]?([AaPp])\.?[Mm]\.?)?')
+# The most common export layout, 'dd/dd/dddd, dd:dd', is sliced at fixed offsets without a regex
+_FIXED_LAYOUT_LENGTH: int = 17
+
+Fields = Tuple[int, int, int, int, int]
+
+
+class DateOrder(Enum):
+    DAY_FIRST = 1
+    MONTH_FIRST = 2
+
+
+class TimestampParser:
+    """
+    Parses message header timestamps for one export. The day/month order is detected once from a
+    sample of headers; every header is then split into integers and the resulting datetimes cached.
+    """
+    SAMPLE_SIZE: int = 1000
+    CACHE_SIZE: int = 1 << 12
+
+    def __init__(self, date_order: DateOrder = DateOrder.DAY_FIRST) -> None:
+        self.date_order = date_order
+        self.parse = lru_cache(maxsize=TimestampParser.CACHE_SIZE)(self._parse)
+
+    @staticmethod
+    def from_sample(timestamps: Sequence[str]) -> 'TimestampParser':
+        return TimestampParser(TimestampParser.detect_date_order(timestamps))
+
+    @staticmethod
+    def detect_date_order(timestamps: Sequence[str]) -> DateOrder:
+        fields = [TimestampParser.split_fields(timestamp) for timestamp in timestamps]
+        first_over_12 = any(first > 12 for first, _, _, _, _ in fields)
+        second_over_12 = any(second > 12 for _, second, _, _, _ in fields)
+        if first_over_12 != second_over_12:
+            return DateOrder.DAY_FIRST if first_over_12 else DateOrder.MONTH_FIRST
+
+        # Nothing unambiguous in the sample: pick the order under which the messages are (most) chronological
+        day_first_breaks = TimestampParser._count_order_breaks(fields, DateOrder.DAY_FIRST)
+        month_first_breaks = TimestampParser._count_order_breaks(fields, DateOrder.MONTH_FIRST)
+        return DateOrder.MONTH_FIRST if month_first_breaks < day_first_breaks else DateOrder.DAY_FIRST
+
+    @staticmethod
+    def split_fields(timestamp: str) -> Fields:
+        if len(timestamp) == _FIXED_LAYOUT_LENGTH and timestamp[10] == ',':
+            return (int(timestamp[0:2]), int(timestamp[3:5]), int(timestamp[6:10]),
+                    int(timestamp[12:14]), int(timestamp[15:17]))
+        match = _TIMESTAMP_REGEX.fullmatch(timestamp)
+        if match is None:
+            raise ValueError(f'Unrecognised timestamp: {timestamp!r}')
+        first, second, year, hour, minute, meridiem = match.groups()
+        year, hour = int(year), int(hour)
+        if year < 100:
+            year += 2000
+        if meridiem is not None:
+            hour = hour % 12 + (12 if meridiem in 'Pp' else 0)
+        return int(first), int(second), year, hour, int(minute)
+
+    def _parse(self, timestamp: str) -> datetime.datetime:
+        fields = TimestampParser.split_fields(timestamp)
+        parsed = TimestampParser._to_datetime(fields, self.date_order)
+        if parsed is None:
+            # A stray header that only makes sense in the other order (e.g. an edited export)
+            other_order = DateOrder.MONTH_FIRST if self.date_order == DateOrder.DAY_FIRST else DateOrder.DAY_FIRST
+            parsed = TimestampParser._to_datetime(fields, other_order)
+        if parsed is None:
+            raise ValueError(f'Invalid timestamp: {timestamp!r}')
+        return parsed
+
+    @staticmethod
+    def _to_datetime(fields: Fields, date_order: DateOrder) -> Optional[datetime.datetime]:
+        first, second, year, hour, minute = fields
+        day, month = (first, second) if date_order == DateOrder.DAY_FIRST else (second, first)
+        try:
+            return datetime.datetime(year, month, day, hour, minute)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _count_order_breaks(fields: Sequence[Fields], date_order: DateOrder) -> int:
+        breaks = 0
+        previous = None
+        for timestamp_fields in fields:
+            current = TimestampParser._to_datetime(timestamp_fields, date_order)
+            if current is None or (previous is not None and current < previous):
+                breaks += 1
+            previous = current or previous
+        return breaks
@@ -1,21 +1,22 @@
-from enum import Enum
+import os
+from typing import List, Optional, Tuple
 
-CHAT_PATH: str = '/resources/CompleteChat.txt'
+CHAT_PATH: str = os.environ.get('WHATSAPP_CHAT_PATH', '/resources/CompleteChat.txt')
 OUTPUT_PATH: str = 'chat_dir/'
-RESOURCES_PATH: str = 'resources'
+OUTPUT_FORMAT: str = 'png'
+# Page compositing backend, 'pillow' or 'numpy' (needs NumPy); both produce the same pixels
+COMPOSITOR: str = 'pillow'
+# Fonts and images are read from here when first drawn, see `whatsapp_page.resource_manager`
+RESOURCES_PATH: str = os.environ.get('WHATSAPP_RESOURCES_PATH', 'resources')
+RENDER_WORKERS: int = os.cpu_count() or 1
+MAX_PAGES_IN_FLIGHT: int = 2 * RENDER_WORKERS
+MAX_CONCURRENT_EXPORTS: int = 4
+# Rendered pages kept in memory by a `PagedChat`; each one holds a full-size RGBA image
+PAGE_CACHE_SIZE: int = 8
 
-
-class Participants(Enum):
-    SHASHANK = "Shashank Ullas"
-    SHRAVYA = "Shravya"
-
-    @staticmethod
-    def get_participant(sender: str):
-        if Participants.SHASHANK.value.lower() == sender.lower():
-            return Participants.SHASHANK
-        else:
-            return Participants.SHRAVYA
-
-    @staticmethod
-    def main_participant():
-        return Participants.SHRAVYA.value
+# Participants used when no participants config is given and the export is not scanned for senders
+PARTICIPANTS: List[str] = ['Shashank Ullas', 'Shravya']
+MAIN_PARTICIPANT: str = 'Shravya'
+PARTICIPANTS_CONFIG_PATH: Optional[str] = None
+MAIN_PARTICIPANT_COLOR: Tuple[int, int, int] = (0, 92, 75)
+PARTICIPANT_COLOR: Tuple[int, int, int] = (32, 44, 51)
@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import constants
+from chat_parser.chat_parser import parse_chat
+from chat_parser.chat_reader import detect_timestamp_parser, discover_participants, read_head
+from chat_parser.timestamps import DateOrder, TimestampParser
+from instrumentation.metrics import METRICS
+from models.chat_store import ChatStore
+from models.participants import ParticipantRegistry
+from whatsapp_page.output_format import OutputFormat
+from whatsapp_page.page_layout import PageJob, PagePlan
+from whatsapp_page.whatsapp_paginator import WhatsappPaginator
+
+logger = logging.getLogger(__name__)
+
+
+class RenderedPage:
+    __slots__ = ('job_id', 'page_number', 'data', 'extension')
+
+    def __init__(self, job_id: int, page_number: int, data: bytes, extension: str) -> None:
+        self.job_id = job_id
+        self.page_number = page_number
+        self.data = data
+        self.extension = extension
+
+    def __repr__(self) -> str:
+        return f'RenderedPage {self.page_number} of job {self.job_id} ({len(self.data)} bytes)'
+
+
+class ExportJob:
+    """
+    Handle for one export. Iterating it yields pages as soon as they are rendered (not necessarily in page
+    order); at most `max_in_flight` pages are rendered ahead of the consumer. Iteration stops early when the
+    job is cancelled and re-raises the error of a failed job.
+    """
+    QUEUED: str = 'queued'
+    PARSING: str = 'parsing'
+    RENDERING: str = 'rendering'
+    DONE: str = 'done'
+    CANCELLED: str = 'cancelled'
+    FAILED: str = 'failed'
+
+    def __init__(self, job_id: int, max_in_flight: int) -> None:
+        self.job_id = job_id
+        self.status = ExportJob.QUEUED
+        self.page_count: Optional[int] = None
+        self.pages_rendered = 0
+        self.submitted_at = time.perf_counter()
+        self.first_page_seconds: Optional[float] = None
+        self._pages: asyncio.Queue = asyncio.Queue(maxsize=max_in_flight)
+        self._task: Optional[asyncio.Task] = None
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def wait(self) -> None:
+        await asyncio.wait({self._task})
+
+    def __aiter__(self) -> AsyncIterator[RenderedPage]:
+        return self._iter_pages()
+
+    async def _iter_pages(self) -> AsyncIterator[RenderedPage]:
+        while True:
+            if self._task.cancelled():
+                return
+            if self._pages.empty() and self._task.done():
+                self._task.result()
+                return
+            next_page = asyncio.ensure_future(self._pages.get())
+            await asyncio.wait({next_page, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            if next_page.done():
+                yield next_page.result()
+            else:
+                next_page.cancel()
+
+    def get_status(self) -> Dict[str, object]:
+        return {'job_id': self.job_id, 'status': self.status, 'page_count': self.page_count,
+                'pages_rendered': self.pages_rendered, 'first_page_seconds': self.first_page_seconds}
+
+    def __repr__(self) -> str:
+        return f'ExportJob {self.job_id} ({self.status})'
+
+
+class ExportService:
+    """
+    Runs chat exports concurrently on one shared process pool: parsing and page layout happen in a worker,
+    then the pages are fanned out to the pool and streamed back through the job. The first `HEAD_MESSAGES`
+    messages are parsed on their own so the first pages render without waiting for the whole chat.
+    At most `max_jobs` exports run at a time; further jobs wait in line.
+    """
+    HEAD_MESSAGES: int = 200
+
+    def __init__(self, workers: Optional[int] = None, max_jobs: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, output_format: Optional[str] = None) -> None:
+        self.workers = workers or constants.RENDER_WORKERS
+        self.max_jobs = max_jobs or constants.MAX_CONCURRENT_EXPORTS
+        self.max_in_flight = max(1, max_in_flight or constants.MAX_PAGES_IN_FLIGHT)
+        self.output_format = OutputFormat.get(output_format)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._job_slots: Optional[asyncio.Semaphore] = None
+        self._job_ids = itertools.count(1)
+        self.jobs: Dict[int, ExportJob] = {}
+
+    async def __aenter__(self) -> 'ExportService':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             initializer=WhatsappPaginator.get_worker_initializer())
+        self._job_slots = asyncio.Semaphore(self.max_jobs)
+        # Workers are started on demand; start them now so the first job doesn't pay for starting and preloading
+        for _ in range(self.workers):
+            self._executor.submit(int)
+
+    async def close(self) -> None:
+        running = [job for job in self.jobs.values() if not job._task.done()]
+        for job in running:
+            job.cancel()
+        await asyncio.gather(*(job.wait() for job in running))
+        await asyncio.to_thread(self._executor.shutdown, wait=True, cancel_futures=True)
+
+    def submit(self, chat_text: str, registry: Optional[ParticipantRegistry] = None,
+               main_participant: Optional[str] = None, limit: Optional[int] = None) -> ExportJob:
+        if self._executor is None:
+            raise RuntimeError('The export service has not been started')
+        job = ExportJob(next(self._job_ids), self.max_in_flight)
+        job._task = asyncio.create_task(self._run(job, chat_text, registry, main_participant, limit))
+        self.jobs[job.job_id] = job
+        return job
+
+    def get_job(self, job_id: int) -> ExportJob:
+        return self.jobs[job_id]
+
+    def cancel(self, job_id: int) -> None:
+        self.jobs[job_id].cancel()
+
+    async def _run(self, job: ExportJob, chat_text: str, registry: Optional[ParticipantRegistry],
+                   main_participant: Optional[str], limit: Optional[int]) -> None:
+        loop = asyncio.get_running_loop()
+        pending: Set[asyncio.Future] = set()
+        full_parse: Optional[asyncio.Future] = None
+        try:
+            async with self._job_slots:
+                job.status = ExportJob.PARSING
+                head_limit = min(limit, ExportService.HEAD_MESSAGES) if limit is not None else \
+                    ExportService.HEAD_MESSAGES
+                # Only the head goes to the worker; its senders are discovered from the head alone
+                head_text = read_head(chat_text, head_limit)
+                discover = registry is None
+                texts, page_plans, date_order = await loop.run_in_executor(
+                    self._executor, ExportService.parse_job, head_text, registry, main_participant, head_limit,
+                    discover)
+                head_only = head_limit == limit or len(head_text) == len(chat_text)
+                if head_only:
+                    job.page_count = len(page_plans)
+                else:
+                    # Layout is a forward sweep, so every page of the head but the last one is final
+                    page_plans = page_plans[:-1]
+
+                job.status = ExportJob.RENDERING
+                pending = await self._render_pages(job, texts, page_plans, pending)
+                if not head_only:
+                    # Queued behind the head pages so they come first. Only the rest of the export is parsed,
+                    # onto the head's chat boxes and with the head's date order, so the pages already sent stay
+                    # valid; discovery extends the head's registry, so its participants keep their ids
+                    full_parse = loop.run_in_executor(self._executor, ExportService.parse_job,
+                                                      chat_text[len(head_text):], registry, main_participant, limit,
+                                                      discover, (texts, date_order))
+                    texts, all_page_plans, _ = await full_parse
+                    job.page_count = len(all_page_plans)
+                    pending = await self._render_pages(job, texts, all_page_plans[len(page_plans):], pending)
+                while pending:
+                    pending = await self._deliver_completed(job, pending)
+            job.status = ExportJob.DONE
+        except asyncio.CancelledError:
+            job.status = ExportJob.CANCELLED
+            raise
+        except Exception:
+            job.status = ExportJob.FAILED
+            logger.exception('Export job %d failed', job.job_id)
+            raise
+        finally:
+            # Work that has not started yet is dropped; pages already rendering finish in their worker
+            for future in [*pending, full_parse]:
+                if future is not None:
+                    future.cancel()
+
+    async def _render_pages(self, job: ExportJob, texts: ChatStore, page_plans: List[PagePlan],
+                            pending: Set[asyncio.Future]) -> Set[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        for page_plan in page_plans:
+            while len(pending) >= self.max_in_flight:
+                pending = await self._deliver_completed(job, pending)
+            page_job = WhatsappPaginator.get_page_job(texts, page_plan, self.output_format, PageJob.TARGET_BYTES)
+            pending.add(loop.run_in_executor(self._executor, WhatsappPaginator.render_job, page_job))
+        return pending
+
+    async def _deliver_completed(self, job: ExportJob, pending: Set[asyncio.Future]) -> Set[asyncio.Future]:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            page_number, worker_metrics, data = future.result()
+            METRICS.merge(worker_metrics)
+            # Waits here while the consumer is behind, which in turn stops new pages from being submitted
+            await job._pages.put(RenderedPage(job.job_id, page_number, data, self.output_format.extension))
+            job.pages_rendered += 1
+            if job.first_page_seconds is None:
+                job.first_page_seconds = time.perf_counter() - job.submitted_at
+        return pending
+
+    @staticmethod
+    def parse_job(chat_text: str, registry: Optional[ParticipantRegistry], main_participant: Optional[str],
+                  limit: Optional[int], discover: bool = True, head: Optional[Tuple[ChatStore, DateOrder]] = None
+                  ) -> Tuple[ChatStore, List[PagePlan], DateOrder]:
+        # With `head` (the chat boxes and date order of the start of the export), `chat_text` is the rest of
+        # the export and its messages are appended to the head's
+        chat_lines = chat_text.splitlines(keepends=True)
+        all_texts, date_order = head if head is not None else (None, None)
+        if all_texts is not None:
+            registry = all_texts.registry
+            limit = limit - all_texts.message_count if limit is not None else None
+        if discover:
+            registry = discover_participants(chat_lines, main_participant, registry)
+        if date_order is None:
+            date_order = detect_timestamp_parser(iter(chat_lines))[0].date_order
+        texts = parse_chat(chat_lines, limit=limit if limit is not None else float('inf'), registry=registry,
+                           timestamp_parser=TimestampParser(date_order), all_texts=all_texts)
+        return texts, WhatsappPaginator.plan_pages(texts), date_order
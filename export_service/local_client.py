@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+from export_service.export_service import ExportService, RenderedPage
+from whatsapp_page.output_format import OUTPUT_FORMATS
+
+logger = logging.getLogger(__name__)
+
+
+class ExportClient:
+    """
+    In-process client for `ExportService`, addressing jobs by id the way a remote client would, so the
+    service can be driven and tested locally without a network front end.
+    """
+
+    def __init__(self, service: ExportService) -> None:
+        self.service = service
+
+    def start_export(self, chat_text: str, main_participant: Optional[str] = None,
+                     limit: Optional[int] = None) -> int:
+        return self.service.submit(chat_text, main_participant=main_participant, limit=limit).job_id
+
+    def pages(self, job_id: int) -> AsyncIterator[RenderedPage]:
+        return aiter(self.service.get_job(job_id))
+
+    def cancel(self, job_id: int) -> None:
+        self.service.cancel(job_id)
+
+    def status(self, job_id: int) -> Dict[str, object]:
+        return self.service.get_job(job_id).get_status()
+
+    async def export(self, chat_text: str, main_participant: Optional[str] = None,
+                     limit: Optional[int] = None) -> List[RenderedPage]:
+        job_id = self.start_export(chat_text, main_participant, limit)
+        pages = [page async for page in self.pages(job_id)]
+        return sorted(pages, key=lambda page: page.page_number)
+
+
+async def _export_to_directory(client: ExportClient, chat_text: str, output_path: str,
+                               main_participant: Optional[str], limit: Optional[int]) -> None:
+    job_id = client.start_export(chat_text, main_participant, limit)
+    async for page in client.pages(job_id):
+        with open(os.path.join(output_path, f'{job_id}-{page.page_number}.{page.extension}'), 'wb') as f:
+            f.write(page.data)
+    logger.info('Job %d finished: %s', job_id, client.status(job_id))
+
+
+async def _run_local_exports(args: argparse.Namespace) -> None:
+    os.makedirs(args.output, exist_ok=True)
+    async with ExportService(workers=args.workers, max_jobs=args.max_jobs, output_format=args.format) as service:
+        client = ExportClient(service)
+        exports = []
+        for chat_path in args.chats:
+            with open(chat_path, encoding='utf-8-sig') as f:
+                exports.append(_export_to_directory(client, f.read(), args.output, args.me, args.limit))
+        await asyncio.gather(*exports)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Export chats through the export service without a server.')
+    arg_parser.add_argument('chats', nargs='+', help='exported WhatsApp chats, each one is submitted as its own job')
+    arg_parser.add_argument('--output', default='export_dir/', help='folder the rendered pages are written to')
+    arg_parser.add_argument('--format', default=None, choices=sorted(OUTPUT_FORMATS),
+                            help='encoder preset used for the page images')
+    arg_parser.add_argument('--me', help='name of the participant whose messages are drawn on the right')
+    arg_parser.add_argument('--limit', type=int, help='only export the first LIMIT messages of each chat')
+    arg_parser.add_argument('--workers', type=int, help='size of the shared render pool')
+    arg_parser.add_argument('--max-jobs', type=int, help='number of exports rendered at the same time')
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+    asyncio.run(_run_local_exports(args))
+
+
+if __name__ == '__main__':
+    main()
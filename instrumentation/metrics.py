@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import time
+from array import array
+from collections import defaultdict
+from contextlib import ContextDecorator
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer(ContextDecorator):
+    def __init__(self, metrics: 'Metrics', stage: str, log: bool) -> None:
+        self.metrics = metrics
+        self.stage = stage
+        self.log = log
+        self._start = 0.0
+
+    def _recreate_cm(self) -> 'StageTimer':
+        # Each decorated call gets its own timer so nested and concurrent calls don't share a start time
+        return StageTimer(self.metrics, self.stage, self.log)
+
+    def __enter__(self) -> 'StageTimer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        elapsed = time.perf_counter() - self._start
+        self.metrics.record(self.stage, elapsed)
+        if self.log:
+            logger.info('%s finished in %.3fs', self.stage, elapsed)
+
+
+class Metrics:
+    """
+    Per-process timers, counters and cache statistics. Worker processes hand their numbers back with
+    `snapshot()` and the parent folds them in with `merge()`.
+    """
+    PERCENTILES: List[int] = [50, 90, 99]
+
+    def __init__(self) -> None:
+        self._durations: Dict[str, array] = defaultdict(lambda: array('d'))
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._caches: Dict[str, Callable] = {}
+        self._cache_seen: Dict[str, tuple] = {}
+
+    def timer(self, stage: str, log: bool = False) -> StageTimer:
+        return StageTimer(self, stage, log)
+
+    def record(self, stage: str, seconds: float) -> None:
+        self._durations[stage].append(seconds)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        self._counters[counter] += amount
+
+    def register_cache(self, name: str, cached_fn: Callable) -> None:
+        # `cached_fn` is anything exposing functools' `cache_info()`
+        self._caches[name] = cached_fn
+
+    def reset(self) -> None:
+        self._collect_cache_stats()
+        self._durations.clear()
+        self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        # Returns everything recorded since the previous snapshot and starts counting afresh
+        self._collect_cache_stats()
+        snapshot = {'durations': {stage: durations.tolist() for stage, durations in self._durations.items()},
+                    'counters': dict(self._counters)}
+        self._durations.clear()
+        self._counters.clear()
+        return snapshot
+
+    def merge(self, snapshot: Dict[str, Dict]) -> None:
+        for stage, durations in snapshot['durations'].items():
+            self._durations[stage].extend(durations)
+        for counter, amount in snapshot['counters'].items():
+            self._counters[counter] += amount
+
+    def report(self) -> Dict[str, Dict]:
+        self._collect_cache_stats()
+        stages = {}
+        for stage, durations in self._durations.items():
+            ordered = sorted(durations)
+            stage_report = {'count': len(ordered), 'total_seconds': sum(ordered),
+                            'mean_seconds': sum(ordered) / len(ordered) if ordered else 0.0}
+            for percentile in Metrics.PERCENTILES:
+                stage_report[f'p{percentile}_seconds'] = Metrics._percentile(ordered, percentile)
+            stages[stage] = stage_report
+
+        caches = {}
+        for counter, hits in self._counters.items():
+            if counter.startswith('cache_hits.'):
+                name = counter[len('cache_hits.'):]
+                misses = self._counters.get(f'cache_misses.{name}', 0)
+                caches[name] = {'hits': hits, 'misses': misses,
+                                'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+        counters = {counter: amount for counter, amount in self._counters.items() if not counter.startswith('cache_')}
+        return {'stages': stages, 'counters': counters, 'caches': caches}
+
+    def write_report(self, file_name: str, extra: Optional[Dict] = None) -> None:
+        report = self.report()
+        if extra:
+            report.update(extra)
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    def _collect_cache_stats(self) -> None:
+        for name, cached_fn in self._caches.items():
+            info = cached_fn.cache_info()
+            seen_hits, seen_misses = self._cache_seen.get(name, (0, 0))
+            if info.hits < seen_hits or info.misses < seen_misses:
+                # The cache was cleared since we last looked
+                seen_hits, seen_misses = 0, 0
+            self._counters[f'cache_hits.{name}'] += info.hits - seen_hits
+            self._counters[f'cache_misses.{name}'] += info.misses - seen_misses
+            self._cache_seen[name] = (info.hits, info.misses)
+
+    @staticmethod
+    def _percentile(ordered: List[float], percentile: int) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, (len(ordered) * percentile) // 100)]
+
+
+METRICS = Metrics()
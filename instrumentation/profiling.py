@@ -0,0 +1,46 @@
+import cProfile
+import tracemalloc
+from typing import Dict, Optional
+
+
+class RunProfiler:
+    """Opt-in cProfile and tracemalloc capture around a whole run."""
+
+    def __init__(self, profile_path: Optional[str] = None, trace_memory: bool = False,
+                 top_allocations: int = 25) -> None:
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self._profiler: Optional[cProfile.Profile] = None
+        self._memory_report: Dict[str, object] = {}
+
+    def __enter__(self) -> 'RunProfiler':
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            top_stats = tracemalloc.take_snapshot().statistics('lineno')[:self.top_allocations]
+            tracemalloc.stop()
+            self._memory_report = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top_allocations': [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+                                    for stat in top_stats],
+            }
+
+    def report(self) -> Dict[str, object]:
+        report: Dict[str, object] = {}
+        if self.profile_path:
+            report['profile_path'] = self.profile_path
+        if self._memory_report:
+            report['memory'] = self._memory_report
+        return report
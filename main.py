@@ -1,110 +1,167 @@
+import argparse
 import datetime
-import re
-import textwrap
-from typing import List
-
-from tqdm import tqdm
-
-from constants import Participants, CHAT_PATH
-from models.whatsapp_text import WhatsappText
+import hashlib
+import io
+import logging
+import os
+from itertools import chain
+from typing import Dict, Optional, Tuple
+
+from chat_parser.chat_parser import parse_chat
+from chat_parser.chat_reader import detect_timestamp_parser, discover_participants, is_message_header
+from chat_parser.timestamps import DateOrder, TimestampParser
+from constants import CHAT_PATH, COMPOSITOR, OUTPUT_FORMAT, OUTPUT_PATH, PARTICIPANTS_CONFIG_PATH, RESOURCES_PATH
+from instrumentation.metrics import METRICS
+from instrumentation.profiling import RunProfiler
+from models.chat_cache import CachedChat, ChatCache
+from models.chat_index import ChatQuery
+from models.chat_store import ChatStore
+from models.participants import ParticipantRegistry
 from whatsapp_page.elements.chat_box.chat_box import ChatBox
 from whatsapp_page.elements.page_elements import WhatsappPageElement
+from whatsapp_page.output_format import OUTPUT_FORMATS
+from whatsapp_page.page_compositor import COMPOSITORS
+from whatsapp_page.resource_manager import RESOURCES
 from whatsapp_page.whatsapp_paginator import WhatsappPaginator
 
-
-def load_chat(filename):
-    with open(filename, encoding='utf-8') as f:
-        return f.read()
-
-
-def get_sent_time(sent_time: str, previous_time: datetime.datetime) -> datetime.datetime:
-    sent_time1 = None
-    try:
-        sent_time1 = datetime.datetime.strptime(sent_time, '%d/%m/%Y, %H:%M')
-        if sent_time1 is None:
-            print('')
-        if sent_time1.microsecond - previous_time.microsecond < 0:
-            sent_time1 = None
-    except ValueError:
-        pass
-    try:
-        sent_time2 = datetime.datetime.strptime(sent_time, '%m/%d/%Y, %H:%M')
-        if sent_time1 is None:
-            return sent_time2
-        if sent_time2.microsecond - previous_time.microsecond < 0:
-            return sent_time1
-    except ValueError:
-        return sent_time1
-
-    if sent_time1.microsecond - previous_time.microsecond < sent_time2.microsecond - previous_time.microsecond:
-        return sent_time1
-    else:
-        return sent_time2
-
-
-def split(message: str) -> List[str]:
-    smaller_messages = []
-    curr_msg_part = ''
-    for line in message.splitlines(keepends=False):
-        for row in textwrap.wrap(line, width=ChatBox.LETTERS_PER_LINE, replace_whitespace=False):
-            estimated_size = ChatBox.get_box_size(curr_msg_part + row + '\n')
-            estimated_height = estimated_size[1]
-            if estimated_height < WhatsappPageElement.MAX_ELEMENT_HEIGHT:
-                curr_msg_part += row + '\n'
-                continue
-            smaller_messages.append(curr_msg_part)
-            curr_msg_part = row + '\n'
-
-    if curr_msg_part:
-        smaller_messages.append(curr_msg_part)
-    return smaller_messages
-
-
-def add_new_text(all_texts: List[ChatBox], message: str, sent_time: datetime,
-                 sender: Participants, previous_sender: Participants) -> None:
-    new_text = WhatsappText(message=message, delivery_time=sent_time, sender=sender)
-
-    chat_box = ChatBox(new_text, (sender == previous_sender))
-    all_texts.append(chat_box)
-
-
-def parse_chat(chat_text: str, limit: int = float('inf')) -> List[ChatBox]:
-    all_texts = []
-    first_message_timestamp, first_message_time_format = '15/05/2016, 15:50', '%d/%m/%Y, %H:%M'
-    pattern = r'(\d{2}\/\d{2}\/\d{4}, \d{2}:\d{2}) - (' + \
-              Participants.SHRAVYA.value + '|' + Participants.SHASHANK.value + \
-              r'): (.*?)(?=\d{2}\/\d{2}\/\d{4}, \d{2}:\d{2})'
-    parsed_list = re.findall(pattern, chat_text, re.S | re.M)
-    parsed_list = parsed_list if limit > len(parsed_list) else parsed_list[:limit]
-    previous_time = datetime.datetime.strptime(first_message_timestamp, first_message_time_format)
-    previous_sender = None
-    for (sent_time, sender, message) in tqdm(parsed_list, total=len(parsed_list), position=0, leave=True):
-        sent_time, sender, message = get_sent_time(sent_time, previous_time), \
-                                     Participants.get_participant(sender), \
-                                     message.rstrip()
-        estimated_size = ChatBox.get_box_size(message)
-        estimated_height = estimated_size[1]
-        if estimated_height > WhatsappPageElement.MAX_ELEMENT_HEIGHT:
-            messages = split(message)
-            for small_message in messages:
-                add_new_text(all_texts, small_message, sent_time, sender, previous_sender)
-                previous_sender = sender
+logger = logging.getLogger(__name__)
+
+
+def get_cache_settings(limit: int, participants_config: Optional[str], me: Optional[str]) -> Dict[str, object]:
+    # Everything the parsed boxes depend on besides the export itself
+    return {
+        'chat_box': ChatBox.get_render_settings(),
+        'max_box_width': ChatBox.get_max_box_width(),
+        'max_element_height': WhatsappPageElement.MAX_ELEMENT_HEIGHT,
+        'limit': limit if limit != float('inf') else None,
+        'participants_config': participants_config,
+        'me': me,
+    }
+
+
+@METRICS.timer('load_chat', log=True)
+def load_chat(chat_path: str, limit: int = float('inf'), participants_config: Optional[str] = None,
+              me: Optional[str] = None, cache: Optional[ChatCache] = None) -> ChatStore:
+    asset_paths = [ChatBox.get_font_path()] + ([participants_config] if participants_config else [])
+    layout_key = ChatCache.get_layout_key(get_cache_settings(limit, participants_config, me), asset_paths)
+    cached = cache.load(layout_key) if cache is not None else None
+    if cached is not None and cached.is_unchanged(chat_path):
+        METRICS.increment('chat_cache_hits')
+        cached.store.source_key = ChatCache.get_source_key(layout_key, cached.source_hash)
+        return cached.store
+
+    with open(chat_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        digest = hashlib.sha1()
+        all_texts = None
+        if cached is not None and stat.st_size >= cached.source_size:
+            ChatCache.hash_file(f, digest, cached.source_size)
+            if digest.digest() == cached.source_hash:
+                # Same export with newer messages: only the added bytes are parsed
+                all_texts = append_chat(cached, chat_path, limit, participants_config is None)
+                date_order = cached.date_order
+        if all_texts is not None:
+            METRICS.increment('chat_cache_appends')
         else:
-            add_new_text(all_texts, message, sent_time, sender, previous_sender)
+            f.seek(0)
+            digest = hashlib.sha1()
+            all_texts, date_order = parse_export(chat_path, limit, participants_config, me)
+        # Hashed from where the cached prefix ended (or from the start), a chunk at a time
+        ChatCache.hash_file(f, digest, stat.st_size - f.tell())
+
+    if cache is not None:
+        cache.save(layout_key, CachedChat(all_texts, date_order, stat.st_size, stat.st_mtime_ns, digest.digest()))
+    all_texts.source_key = ChatCache.get_source_key(layout_key, digest.digest())
+    return all_texts
 
-        previous_time, previous_sender = sent_time, sender
 
-    return all_texts
+def parse_export(chat_path: str, limit: int, participants_config: Optional[str],
+                 me: Optional[str]) -> Tuple[ChatStore, DateOrder]:
+    with open(chat_path, encoding='utf-8-sig') as chat_file:
+        if participants_config:
+            registry = ParticipantRegistry.load(participants_config)
+        else:
+            with METRICS.timer('discover_participants', log=True):
+                registry = discover_participants(chat_file, me)
+            chat_file.seek(0)
+        timestamp_parser, sample_lines = detect_timestamp_parser(chat_file)
+        all_texts = parse_chat(chain(sample_lines, chat_file), limit, registry, timestamp_parser=timestamp_parser)
+    return all_texts, timestamp_parser.date_order
+
+
+def append_chat(cached: CachedChat, chat_path: str, limit: int, discover: bool) -> Optional[ChatStore]:
+    # Reads the export from where the cached bytes end. Returns None when the added bytes don't start a new
+    # message, i.e. the last cached message goes on
+    with open(chat_path, 'rb') as f:
+        f.seek(cached.source_size)
+        with io.TextIOWrapper(f, encoding='utf-8') as added_lines:
+            added_start = added_lines.tell()
+            first_line = next((line for line in added_lines if line.strip()), None)
+            if first_line is None:
+                return cached.store
+            if not is_message_header(first_line):
+                return None
+
+            all_texts = cached.store
+            if all_texts.message_count >= limit:
+                return all_texts
+            added_lines.seek(added_start)
+            if discover:
+                discover_participants(added_lines, registry=all_texts.registry)
+                added_lines.seek(added_start)
+            return parse_chat(added_lines, limit - all_texts.message_count,
+                              timestamp_parser=TimestampParser(cached.date_order), all_texts=all_texts)
 
 
 def main():
-    print('Reading chat into memory...', flush=True)
-    chat_text = load_chat(CHAT_PATH)
-    print('Loaded chat...', flush=True)
-    print('Parsing chats...', flush=True)
-    all_texts = parse_chat(chat_text, limit=500)
-    print('Parsed through chats...', flush=True)
-    WhatsappPaginator.get_pages(all_texts, save=True)
+    arg_parser = argparse.ArgumentParser(description='Render an exported WhatsApp chat into page images.')
+    arg_parser.add_argument('--chat', default=CHAT_PATH, metavar='PATH', help='exported chat to render')
+    arg_parser.add_argument('--resources', default=RESOURCES_PATH, metavar='PATH',
+                            help='folder with the fonts and images the pages are drawn with')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='only re-render pages that changed since the previous run into the output folder')
+    arg_parser.add_argument('--format', default=OUTPUT_FORMAT, choices=sorted(OUTPUT_FORMATS),
+                            help='encoder preset used for the page images')
+    arg_parser.add_argument('--bundle', choices=WhatsappPaginator.BUNDLE_TARGETS,
+                            help='bundle all pages into one PDF or tiled sheets plus an index')
+    arg_parser.add_argument('--tile-scale', type=float, metavar='SCALE',
+                            help='scale pages down by SCALE on sheets, e.g. 0.25 for a contact sheet (default: 1)')
+    arg_parser.add_argument('--compositor', default=COMPOSITOR, choices=COMPOSITORS,
+                            help='backend that draws the pages; numpy needs NumPy installed')
+    arg_parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat, metavar='YYYY-MM-DD',
+                            help='only render pages with messages from this day on')
+    arg_parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat, metavar='YYYY-MM-DD',
+                            help='only render pages with messages up to this day')
+    arg_parser.add_argument('--search', metavar='WORDS', help='only render pages with messages containing all WORDS')
+    arg_parser.add_argument('--context', type=int, default=0, metavar='PAGES',
+                            help='also render this many pages around each matching page')
+    arg_parser.add_argument('--participants', default=PARTICIPANTS_CONFIG_PATH, metavar='CONFIG',
+                            help='JSON participants config; by default senders are discovered from the export')
+    arg_parser.add_argument('--me', help='name of the participant whose messages are drawn on the right')
+    arg_parser.add_argument('--cache', default=os.path.join(OUTPUT_PATH, ChatCache.FILE_NAME), metavar='PATH',
+                            help='binary cache of the parsed chat, reused while the export is unchanged or only grew')
+    arg_parser.add_argument('--no-cache', action='store_true', help='always parse the export from scratch')
+    arg_parser.add_argument('--report', default=os.path.join(OUTPUT_PATH, 'run_report.json'),
+                            help='where to write the JSON timing report for this run')
+    arg_parser.add_argument('--profile', metavar='PATH', help='capture a cProfile of the run into PATH')
+    arg_parser.add_argument('--trace-memory', action='store_true',
+                            help='trace allocations with tracemalloc and add the top ones to the report')
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+    RESOURCES.configure(args.resources)
+
+    with RunProfiler(args.profile, args.trace_memory) as profiler:
+        cache = ChatCache(args.cache) if not args.no_cache else None
+        all_texts = load_chat(args.chat, limit=500, participants_config=args.participants, me=args.me, cache=cache)
+        query = None
+        if args.date_from or args.date_to or args.search:
+            query = ChatQuery(args.date_from, args.date_to, args.search, args.context)
+        with METRICS.timer('get_pages', log=True):
+            WhatsappPaginator.get_pages(all_texts, save=True, incremental=args.incremental,
+                                        output_format=args.format, bundle=args.bundle, query=query,
+                                        compositor=args.compositor, tile_scale=args.tile_scale)
+    METRICS.write_report(args.report, extra=profiler.report())
+    logger.info('Wrote run report to %s', args.report)
 
 
 if __name__ == '__main__':
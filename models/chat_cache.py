@@ -0,0 +1,121 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import BinaryIO, Dict, Optional
+
+from chat_parser.timestamps import DateOrder
+from models.chat_store import ChatStore
+from models.participants import ParticipantRegistry
+
+_ALIGNMENT: int = 8
+
+
+class CachedChat:
+    """A parsed chat together with what is needed to tell whether (and how) it can be reused for an export."""
+
+    def __init__(self, store: ChatStore, date_order: DateOrder, source_size: int, source_mtime_ns: int,
+                 source_hash: bytes) -> None:
+        self.store = store
+        self.date_order = date_order
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self.source_hash = source_hash
+
+    def is_unchanged(self, chat_path: str) -> bool:
+        stat = os.stat(chat_path)
+        return stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime_ns
+
+    def __repr__(self) -> str:
+        return f'CachedChat ({len(self.store)} chat boxes from {self.source_size} bytes)'
+
+
+class ChatCache:
+    """
+    Binary cache of a parsed chat: a fixed header, the participants as JSON and the `ChatStore` columns
+    and text buffer, each section 8-byte aligned. Loading memory-maps the file and reads the columns in place.
+    The layout key covers everything the stored sizes and splits depend on; a different key means a miss.
+    """
+    FILE_NAME: str = 'chat_cache.bin'
+    MAGIC: bytes = b'WACHATC\0'
+    VERSION: int = 1
+    # magic, version, layout key, source size, source mtime, source hash, date order, messages, boxes,
+    # text bytes, participants bytes
+    _HEADER = struct.Struct('<8sI20sQq20sIQQQQ')
+    HASH_CHUNK_SIZE: int = 1 << 20
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+
+    @staticmethod
+    def hash_file(f: BinaryIO, digest: 'hashlib._Hash', length: int) -> None:
+        # Feeds the next `length` bytes of `f` to `digest` without holding more than a chunk in memory
+        while length > 0:
+            chunk = f.read(min(length, ChatCache.HASH_CHUNK_SIZE))
+            if not chunk:
+                break
+            digest.update(chunk)
+            length -= len(chunk)
+
+    @staticmethod
+    def get_layout_key(settings: Dict[str, object], asset_paths: Optional[list] = None) -> bytes:
+        digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        digest.update(str(ChatCache.VERSION).encode('ascii'))
+        for asset_path in sorted(asset_paths or []):
+            with open(asset_path, 'rb') as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+        return digest.digest()
+
+    @staticmethod
+    def get_source_key(layout_key: bytes, source_hash: bytes) -> str:
+        return hashlib.sha1(layout_key + source_hash).hexdigest()
+
+    def load(self, layout_key: bytes) -> Optional[CachedChat]:
+        try:
+            with open(self.file_name, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(buffer) < ChatCache._HEADER.size:
+            return None
+        (magic, version, cached_key, source_size, source_mtime_ns, source_hash, date_order, message_count, boxes,
+         text_bytes, participants_bytes) = ChatCache._HEADER.unpack_from(buffer)
+        if magic != ChatCache.MAGIC or version != ChatCache.VERSION or cached_key != layout_key:
+            return None
+
+        view = memoryview(buffer)
+        offset = ChatCache._align(ChatCache._HEADER.size)
+        registry = ParticipantRegistry.from_config(json.loads(bytes(view[offset:offset + participants_bytes])))
+        offset = ChatCache._align(offset + participants_bytes)
+        columns = {}
+        for name, typecode in ChatStore.COLUMNS.items():
+            length = boxes + 1 if name == 'text_offsets' else boxes
+            end = offset + length * struct.calcsize(typecode)
+            if end > len(buffer):
+                return None
+            columns[name] = view[offset:end].cast(typecode)
+            offset = ChatCache._align(end)
+        if offset + text_bytes > len(buffer):
+            return None
+        store = ChatStore.from_columns(registry, columns, view[offset:offset + text_bytes], message_count)
+        return CachedChat(store, DateOrder(date_order), source_size, source_mtime_ns, source_hash)
+
+    def save(self, layout_key: bytes, cached: CachedChat) -> None:
+        store = cached.store
+        participants = json.dumps(store.registry.get_config()).encode('utf-8')
+        text_buffer = store.get_text_buffer()
+        header = ChatCache._HEADER.pack(ChatCache.MAGIC, ChatCache.VERSION, layout_key, cached.source_size,
+                                        cached.source_mtime_ns, cached.source_hash, cached.date_order.value,
+                                        store.message_count, len(store), len(text_buffer), len(participants))
+        os.makedirs(os.path.dirname(self.file_name) or '.', exist_ok=True)
+        # Written next to the old cache and swapped in, so a crash never leaves a half-written cache behind
+        with open(self.file_name + '.tmp', 'wb') as f:
+            for section in [header, participants, *store.get_columns().values(), text_buffer]:
+                f.write(section)
+                f.write(b'\0' * (ChatCache._align(f.tell()) - f.tell()))
+        os.replace(self.file_name + '.tmp', self.file_name)
+
+    @staticmethod
+    def _align(offset: int) -> int:
+        return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
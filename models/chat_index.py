@@ -0,0 +1,150 @@
+import datetime
+import json
+import os
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Set
+
+from models.chat_store import EPOCH, ChatStore
+from whatsapp_page.page_layout import PagePlan
+
+_TOKEN_REGEX = re.compile(r'\w+')
+
+
+class ChatQuery:
+    """Selects chat boxes by delivery date (inclusive range) and/or words that must all appear in the box."""
+
+    def __init__(self, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                 text: Optional[str] = None, context_pages: int = 0) -> None:
+        self.date_from = date_from
+        self.date_to = date_to
+        self.text = text
+        self.context_pages = context_pages
+
+    def __repr__(self) -> str:
+        return f'ChatQuery ({self.date_from} to {self.date_to}, {self.text!r}, +-{self.context_pages} pages)'
+
+
+class ChatIndex:
+    """
+    Lookup tables over the chat boxes of a `ChatStore`, addressed by box index: day -> runs of boxes,
+    word -> boxes containing it and, once the chat is paginated, box -> page number. A saved index is
+    reused for a store with the same `source_key`.
+    """
+    FILE_NAME: str = 'chat_index.json'
+    VERSION: int = 2
+
+    def __init__(self, source_key: Optional[str] = None) -> None:
+        self.source_key = source_key
+        # Exports are chronological, so a day is normally a single [start, end) run of boxes
+        self.day_runs: Dict[int, List[List[int]]] = {}
+        self.postings: Dict[str, array] = {}
+        self.page_numbers = array('I')
+        self._last_day: Optional[int] = None
+
+    @staticmethod
+    def from_store(store: ChatStore) -> 'ChatIndex':
+        index = ChatIndex(store.source_key)
+        for idx in range(len(store)):
+            index.add_text(idx, store.get_message(idx), store.get_day(idx))
+        return index
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return _TOKEN_REGEX.findall(text.lower())
+
+    def add_text(self, text_id: int, message: str, day: int) -> None:
+        runs = self.day_runs.setdefault(day, [])
+        if day == self._last_day and runs[-1][1] == text_id:
+            runs[-1][1] = text_id + 1
+        else:
+            runs.append([text_id, text_id + 1])
+        self._last_day = day
+
+        for token in set(ChatIndex.tokenize(message)):
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array('I')
+            postings.append(text_id)
+
+    def set_pages(self, page_plans: Iterable[PagePlan]) -> None:
+        self.page_numbers = array('I')
+        for page_plan in page_plans:
+            self.page_numbers.extend([page_plan.page_number] * len(page_plan))
+
+    def find_dates(self, date_from: Optional[datetime.date] = None,
+                   date_to: Optional[datetime.date] = None) -> Set[int]:
+        first_day = (date_from - EPOCH.date()).days if date_from is not None else float('-inf')
+        last_day = (date_to - EPOCH.date()).days if date_to is not None else float('inf')
+        text_ids = set()
+        for day, runs in self.day_runs.items():
+            if first_day <= day <= last_day:
+                for start, end in runs:
+                    text_ids.update(range(start, end))
+        return text_ids
+
+    def search(self, text: str) -> Set[int]:
+        text_ids: Optional[Set[int]] = None
+        # Rarest word first keeps the intersections small
+        for token in sorted(set(ChatIndex.tokenize(text)), key=lambda token: len(self.postings.get(token, ()))):
+            matches = self.postings.get(token, ())
+            text_ids = set(matches) if text_ids is None else text_ids.intersection(matches)
+            if not text_ids:
+                break
+        return text_ids or set()
+
+    def find_texts(self, query: ChatQuery) -> Set[int]:
+        text_ids = None
+        if query.date_from is not None or query.date_to is not None:
+            text_ids = self.find_dates(query.date_from, query.date_to)
+        if query.text:
+            matches = self.search(query.text)
+            text_ids = matches if text_ids is None else text_ids & matches
+        return text_ids if text_ids is not None else set(range(len(self.page_numbers)))
+
+    def find_pages(self, query: ChatQuery) -> List[int]:
+        if len(self.page_numbers) == 0 and self.day_runs:
+            raise ValueError('The index has no page numbers yet, paginate the chat first')
+        page_count = max(self.page_numbers, default=0)
+        pages = set()
+        for text_id in self.find_texts(query):
+            page_number = self.page_numbers[text_id]
+            pages.update(range(max(1, page_number - query.context_pages),
+                               min(page_count, page_number + query.context_pages) + 1))
+        return sorted(pages)
+
+    @staticmethod
+    def load(output_path: str, source_key: Optional[str]) -> Optional['ChatIndex']:
+        # Returns None unless the saved index was built from a store with this (non-empty) source key
+        if source_key is None:
+            return None
+        file_name = os.path.join(output_path, ChatIndex.FILE_NAME)
+        try:
+            with open(file_name, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('version') != ChatIndex.VERSION or saved.get('source_key') != source_key:
+            return None
+        index = ChatIndex(source_key)
+        index.day_runs = {int(day): runs for day, runs in saved['days'].items()}
+        index.postings = {token: array('I', text_ids) for token, text_ids in saved['tokens'].items()}
+        index.page_numbers = array('I', saved['pages'])
+        return index
+
+    def save(self, output_path: str) -> None:
+        os.makedirs(output_path, exist_ok=True)
+        file_name = os.path.join(output_path, ChatIndex.FILE_NAME)
+        saved = {
+            'version': ChatIndex.VERSION,
+            'source_key': self.source_key,
+            'days': {str(day): runs for day, runs in self.day_runs.items()},
+            'tokens': {token: text_ids.tolist() for token, text_ids in self.postings.items()},
+            'pages': self.page_numbers.tolist(),
+        }
+        with open(file_name + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(saved, f, separators=(',', ':'))
+        os.replace(file_name + '.tmp', file_name)
+
+    def __repr__(self) -> str:
+        return f'ChatIndex ({len(self.day_runs)} days, {len(self.postings)} words, {len(self.page_numbers)} boxes)'
@@ -0,0 +1,107 @@
+import datetime
+from array import array
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from models.participants import Participant, ParticipantRegistry
+
+EPOCH: datetime.datetime = datetime.datetime(1970, 1, 1)
+SECONDS_PER_DAY: int = 24 * 60 * 60
+
+
+class ChatStore:
+    """
+    Struct-of-arrays storage for the chat boxes of a parsed chat. Message texts live UTF-8 encoded in
+    a single buffer addressed by offsets; everything else is kept in typed arrays, one slot per box.
+    The columns may also be read-only views (e.g. over a memory-mapped cache); they are copied into
+    arrays on the first append.
+    """
+    # Column name -> array typecode, in the order the columns are laid out when serialised
+    COLUMNS: Dict[str, str] = {'sender_ids': 'I', 'timestamps': 'q', 'consecutive': 'B', 'text_widths': 'I',
+                               'text_heights': 'I', 'text_offsets': 'Q'}
+
+    def __init__(self, registry: ParticipantRegistry) -> None:
+        self.registry = registry
+        self.message_count = 0
+        self.sender_ids = array('I')
+        self.timestamps = array('q')
+        self.consecutive = array('B')
+        self.text_widths = array('I')
+        self.text_heights = array('I')
+        self.text_offsets = array('Q', [0])
+        self._text_buffer: Union[bytearray, memoryview] = bytearray()
+        # Identifies the export and layout the boxes were parsed from, so data derived from them can be reused
+        self.source_key: Optional[str] = None
+
+    @staticmethod
+    def from_columns(registry: ParticipantRegistry, columns: Dict[str, Sequence[int]],
+                     text_buffer: Union[bytearray, memoryview], message_count: int) -> 'ChatStore':
+        store = ChatStore(registry)
+        for name, values in columns.items():
+            setattr(store, name, values)
+        store._text_buffer = text_buffer
+        store.message_count = message_count
+        return store
+
+    def get_columns(self) -> Dict[str, Sequence[int]]:
+        return {name: getattr(self, name) for name in ChatStore.COLUMNS}
+
+    def get_text_buffer(self) -> Union[bytearray, memoryview]:
+        return self._text_buffer
+
+    def append(self, message: str, delivery_time: datetime.datetime, sender: Participant, consecutive_msg: bool,
+               text_size: Tuple[int, int]) -> None:
+        if not isinstance(self._text_buffer, bytearray):
+            self._make_writable()
+        self.sender_ids.append(sender.participant_id)
+        self.timestamps.append(int((delivery_time - EPOCH).total_seconds()))
+        self.consecutive.append(consecutive_msg)
+        self.text_widths.append(text_size[0])
+        self.text_heights.append(text_size[1])
+        self._text_buffer += message.encode('utf-8')
+        self.text_offsets.append(len(self._text_buffer))
+
+    def get_message(self, idx: int) -> str:
+        return str(self._text_buffer[self.text_offsets[idx]:self.text_offsets[idx + 1]], 'utf-8')
+
+    def get_delivery_time(self, idx: int) -> datetime.datetime:
+        return EPOCH + datetime.timedelta(seconds=self.timestamps[idx])
+
+    def get_day(self, idx: int) -> int:
+        return self.timestamps[idx] // SECONDS_PER_DAY
+
+    def get_sender(self, idx: int) -> Participant:
+        return self.registry.get(self.sender_ids[idx])
+
+    def get_text_size(self, idx: int) -> Tuple[int, int]:
+        return self.text_widths[idx], self.text_heights[idx]
+
+    def get_record(self, idx: int) -> Tuple[str, datetime.datetime, Participant, bool, Tuple[int, int]]:
+        return (self.get_message(idx), self.get_delivery_time(idx), self.get_sender(idx), bool(self.consecutive[idx]),
+                self.get_text_size(idx))
+
+    def nbytes(self) -> int:
+        arrays = (self.sender_ids, self.timestamps, self.consecutive, self.text_widths, self.text_heights,
+                  self.text_offsets)
+        return len(self._text_buffer) + sum(values.itemsize * len(values) for values in arrays)
+
+    def _make_writable(self) -> None:
+        for name, typecode in ChatStore.COLUMNS.items():
+            values = array(typecode)
+            values.frombytes(getattr(self, name).cast('B'))
+            setattr(self, name, values)
+        self._text_buffer = bytearray(self._text_buffer)
+
+    def __getstate__(self) -> Dict[str, object]:
+        # Views over a memory map can't be pickled (e.g. when handing the store to a worker process)
+        if not isinstance(self._text_buffer, bytearray):
+            self._make_writable()
+        return self.__dict__
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator[Tuple[str, datetime.datetime, Participant, bool, Tuple[int, int]]]:
+        return (self.get_record(idx) for idx in range(len(self)))
+
+    def __repr__(self) -> str:
+        return f'ChatStore ({len(self)} chat boxes, {self.nbytes()} bytes)'
@@ -0,0 +1,88 @@
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import constants
+
+
+class Participant:
+    __slots__ = ('participant_id', 'name', 'box_color', 'align_right')
+
+    def __init__(self, participant_id: int, name: str, box_color: Tuple[int, int, int], align_right: bool) -> None:
+        self.participant_id = participant_id
+        self.name = name
+        self.box_color = box_color
+        self.align_right = align_right
+
+    def __repr__(self) -> str:
+        return f'Participant {self.participant_id} ({self.name})'
+
+
+class ParticipantRegistry:
+    """
+    Interns sender names to `Participant` records with small integer ids. A closed registry only
+    knows the configured (or discovered) participants; an open one registers new senders as it sees them.
+    """
+
+    def __init__(self, main_participant: Optional[str] = None, closed: bool = False) -> None:
+        self.main_participant = main_participant
+        self.closed = closed
+        self._participants: List[Participant] = []
+        self._by_name: Dict[str, Participant] = {}
+
+    @staticmethod
+    def default() -> 'ParticipantRegistry':
+        registry = ParticipantRegistry(constants.MAIN_PARTICIPANT)
+        for name in constants.PARTICIPANTS:
+            registry.register(name)
+        return registry
+
+    @staticmethod
+    def load(file_name: str) -> 'ParticipantRegistry':
+        # {"main_participant": "...", "participants": [{"name": "...", "color": [r, g, b]}, ...]}
+        with open(file_name, encoding='utf-8') as f:
+            return ParticipantRegistry.from_config(json.load(f))
+
+    @staticmethod
+    def from_config(config: Dict) -> 'ParticipantRegistry':
+        registry = ParticipantRegistry(config.get('main_participant', constants.MAIN_PARTICIPANT),
+                                       closed=config.get('closed', True))
+        for participant in config['participants']:
+            color = participant.get('color')
+            registry.register(participant['name'], tuple(color) if color else None)
+        return registry
+
+    def get_config(self) -> Dict:
+        # The inverse of `from_config`; participants keep their ids since they are registered in order
+        return {'main_participant': self.main_participant, 'closed': self.closed,
+                'participants': [{'name': participant.name, 'color': list(participant.box_color)}
+                                 for participant in self._participants]}
+
+    def register(self, name: str, box_color: Optional[Tuple[int, int, int]] = None) -> Participant:
+        participant = self._by_name.get(name)
+        if participant is not None:
+            return participant
+        is_main = name.lower() == (self.main_participant or '').lower()
+        if box_color is None:
+            box_color = constants.MAIN_PARTICIPANT_COLOR if is_main else constants.PARTICIPANT_COLOR
+        participant = Participant(len(self._participants), name, box_color, is_main)
+        self._participants.append(participant)
+        self._by_name[name] = participant
+        return participant
+
+    def lookup(self, name: str) -> Optional[Participant]:
+        participant = self._by_name.get(name)
+        if participant is None and not self.closed:
+            participant = self.register(name)
+        return participant
+
+    def get(self, participant_id: int) -> Participant:
+        return self._participants[participant_id]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __iter__(self) -> Iterator[Participant]:
+        return iter(self._participants)
+
+    def __len__(self) -> int:
+        return len(self._participants)
@@ -1,13 +1,15 @@
 from datetime import datetime
 
-from constants import Participants
+from models.participants import Participant
 
 
 class WhatsappText:
-    def __init__(self, message: str, delivery_time: datetime, sender: Participants) -> None:
+    __slots__ = ('message', 'delivery_time', 'sender')
+
+    def __init__(self, message: str, delivery_time: datetime, sender: Participant) -> None:
         self.message = message
         self.delivery_time = delivery_time
         self.sender = sender
 
     def __repr__(self) -> str:
-        return f'{self.sender.value} ({self.delivery_time}): {self.message}'
+        return f'{self.sender.name} ({self.delivery_time}): {self.message}'
@@ -1,57 +1,74 @@
 import math
-import textwrap
-from typing import Tuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
-from PIL import ImageFont, Image, ImageDraw
+from PIL import Image, ImageDraw
 from PIL.ImageFont import FreeTypeFont
 
-import constants
-from constants import Participants
+from instrumentation.metrics import METRICS
+from models.chat_store import ChatStore
 from models.whatsapp_text import WhatsappText
+from whatsapp_page.elements.chat_box.glyph_atlas import GlyphAtlas
+from whatsapp_page.elements.chat_box.text_metrics import TextMetrics
+from whatsapp_page.elements.chat_box.wrapped_text import WrappedText
 from whatsapp_page.elements.page_elements import WhatsappPageElement
+from whatsapp_page.resource_manager import RESOURCES
+from whatsapp_page.sprite_cache import SpriteCache
 from whatsapp_page.whatsapp_page import WhatsappPage
 
 
 class ChatBox(WhatsappPageElement):
-    FONT_PATH: str = f'{constants.RESOURCES_PATH}/ConsolasM.ttf'
+    FONT_NAME: str = 'ConsolasM.ttf'
     _BORDER_RADIUS: int = 15
     _ARROW_WIDTH: int = 12
     _TEXT_SPACING: int = 6
     _TEXT_BOX_PADDING: Tuple[int, int] = (106, 32)
-    _GREEN_BOX_COLOR: Tuple[int, int, int] = (0, 92, 75)
-    _BLACK_BOX_COLOR: Tuple[int, int, int] = (32, 44, 51)
     MIN_MARGIN: int = 5
     MAX_MARGIN: int = 30
     LETTERS_PER_LINE: int = 110
-    PAGE_SIZE_WIDTH = WhatsappPage.INNER_PAGE_WIDTH
-    MAX_BOX_WIDTH = math.ceil(0.75 * PAGE_SIZE_WIDTH)
-    TEXT_MESSAGE_FONT: FreeTypeFont = ImageFont.truetype(FONT_PATH, size=24)
-    DATETIME_FONT: FreeTypeFont = ImageFont.truetype(FONT_PATH, size=14)
+    TEXT_MESSAGE_FONT_SIZE: int = 24
+    DATETIME_FONT_SIZE: int = 14
+    MEASURE_CACHE_SIZE: int = 1 << 12
+    TEXT_COLOR: str = 'white'
 
-    def __init__(self, text_msg: WhatsappText, consecutive_msg: bool = False) -> None:
+    __slots__ = ('text_msg', 'consecutive_msg', 'rendered', 'img', '_text_size')
+
+    def __init__(self, text_msg: WhatsappText, consecutive_msg: bool = False,
+                 text_size: Optional[Tuple[float, float]] = None) -> None:
         self.text_msg = text_msg
         self.consecutive_msg = consecutive_msg
-        self.margin = ChatBox.MIN_MARGIN if consecutive_msg else ChatBox.MAX_MARGIN
-        self.box_color = ChatBox._GREEN_BOX_COLOR if self.text_msg.sender.value == Participants.main_participant() \
-            else ChatBox._BLACK_BOX_COLOR
         self.rendered = False
         self.img = None
+        self._text_size: Optional[Tuple[float, float]] = text_size
+
+    @staticmethod
+    def from_store(store: ChatStore, idx: int) -> 'ChatBox':
+        message, delivery_time, sender, consecutive_msg, text_size = store.get_record(idx)
+        return ChatBox(WhatsappText(message=message, delivery_time=delivery_time, sender=sender), consecutive_msg,
+                       text_size)
+
+    @property
+    def margin(self) -> int:
+        return ChatBox.MIN_MARGIN if self.consecutive_msg else ChatBox.MAX_MARGIN
 
+    @property
+    def box_color(self) -> Tuple[int, int, int]:
+        return self.text_msg.sender.box_color
+
+    def get_text_size(self) -> Tuple[float, float]:
+        if self._text_size is None:
+            self._text_size = self.get_box_size(self.text_msg.message)
+        return self._text_size
+
+    @METRICS.timer('chat_box.render')
     def render(self) -> Image:
-        w, h = self.get_box_size(self.text_msg.message, ChatBox.TEXT_MESSAGE_FONT)
-        box_size = w + ChatBox._TEXT_BOX_PADDING[0], h + ChatBox._TEXT_BOX_PADDING[1]
-        centre = box_size[0] // 2, box_size[1] // 2
+        box_size, box_rect, radius = self.get_bubble()
         img = Image.new(size=box_size, mode='RGBA')
         draw = ImageDraw.Draw(img)
+        draw.rounded_rectangle(box_rect, fill=self.box_color, radius=radius)
 
-        x0 = (centre[0] - (w + ChatBox._TEXT_BOX_PADDING[0]) // 2)
-        y0 = (centre[1] - (h + ChatBox._TEXT_BOX_PADDING[1]) // 2)
-        x1 = (centre[0] + (w + ChatBox._TEXT_BOX_PADDING[0]) // 2)
-        y1 = (centre[1] + (h + ChatBox._TEXT_BOX_PADDING[1]) // 2)
-        draw.rounded_rectangle((x0, y0, x1, y1), fill=self.box_color, radius=ChatBox._BORDER_RADIUS)
-
-        self._add_text_message(ChatBox.TEXT_MESSAGE_FONT, draw)
-        self._add_timestamp(ChatBox.DATETIME_FONT, draw, w, h)
+        for xy, text, font, anchor, embedded_color in self.get_text_items():
+            ChatBox.draw_text(img, draw, xy, text, font, anchor, embedded_color)
 
         if not self.consecutive_msg:
             img = self._add_pointer(img)
@@ -60,44 +77,98 @@ class ChatBox(WhatsappPageElement):
         self.rendered = True
         return img
 
-    def _add_timestamp(self, time_stamp_font: FreeTypeFont, draw: ImageDraw,
-                       box_width: float, box_height: float) -> None:
-        x_offset, y_offset = 6, 8
-        draw.text((box_width + ChatBox._TEXT_BOX_PADDING[0] - x_offset,
-                   box_height + ChatBox._TEXT_BOX_PADDING[1] - y_offset),
-                  self.get_formatted_time_text(),
-                  fill='white',
-                  anchor='rs',
-                  font=time_stamp_font)
-
-    def _add_text_message(self, font: FreeTypeFont, draw: ImageDraw) -> None:
+    @staticmethod
+    def draw_text(img: Image, draw: ImageDraw, xy: Tuple[int, int], text: str, font: FreeTypeFont,
+                  anchor: Optional[str], embedded_color: bool) -> None:
+        glyphs = GlyphAtlas.for_font(font.path, font.size).get_mask(text, anchor)
+        if glyphs is None:
+            draw.text(xy, text, fill=ChatBox.TEXT_COLOR, anchor=anchor, font=font, embedded_color=embedded_color)
+            return
+        mask, (x, y) = glyphs
+        if embedded_color:
+            # The paste `ImageDraw.text` does for embedded colour text; atlas glyphs are monochrome, so it is all ink
+            img.paste(Image.new('RGBA', mask.size, ChatBox.TEXT_COLOR), (xy[0] + x, xy[1] + y), mask)
+        else:
+            draw.bitmap((xy[0] + x, xy[1] + y), mask, fill=ChatBox.TEXT_COLOR)
+
+    def get_bubble(self) -> Tuple[Tuple[int, int], Tuple[int, int, int, int], int]:
+        # Size of the bubble image, the rounded rectangle drawn into it and its corner radius
+        w, h = self.get_text_size()
+        box_size = w + ChatBox._TEXT_BOX_PADDING[0], h + ChatBox._TEXT_BOX_PADDING[1]
+        centre = box_size[0] // 2, box_size[1] // 2
+        x0 = (centre[0] - (w + ChatBox._TEXT_BOX_PADDING[0]) // 2)
+        y0 = (centre[1] - (h + ChatBox._TEXT_BOX_PADDING[1]) // 2)
+        x1 = (centre[0] + (w + ChatBox._TEXT_BOX_PADDING[0]) // 2)
+        y1 = (centre[1] + (h + ChatBox._TEXT_BOX_PADDING[1]) // 2)
+        return box_size, (x0, y0, x1, y1), ChatBox._BORDER_RADIUS
+
+    def get_text_items(self) -> List[Tuple[Tuple[int, int], str, FreeTypeFont, Optional[str], bool]]:
+        # (position, text, font, anchor, embedded colour) of everything written on the bubble, in drawing order
+        text_items = []
         x_offset = y_offset = 20
-        for line in self.text_msg.message.splitlines(keepends=False):
-            for row in textwrap.wrap(line, width=ChatBox.LETTERS_PER_LINE, replace_whitespace=False):
-                draw.text((x_offset, y_offset), row, fill='white', lign='left', font=font, embedded_color=True)
-                y_offset += font.getsize(line)[1] + ChatBox._TEXT_SPACING
+        font = ChatBox.get_message_font()
+        wrapped = ChatBox.wrap(self.text_msg.message)
+        for row, row_height in zip(wrapped.rows, wrapped.row_heights(font)):
+            text_items.append(((x_offset, y_offset), row, font, None, True))
+            y_offset += row_height + ChatBox._TEXT_SPACING
+
+        w, h = self.get_text_size()
+        x_offset, y_offset = 6, 8
+        text_items.append(((w + ChatBox._TEXT_BOX_PADDING[0] - x_offset, h + ChatBox._TEXT_BOX_PADDING[1] - y_offset),
+                           self.get_formatted_time_text(), ChatBox.get_datetime_font(), 'rs', False))
+        return text_items
 
     def get_approximate_size(self):
-        w, h = self.get_box_size(self.text_msg.message)
-        box_size = w + ChatBox._TEXT_BOX_PADDING[0] + ChatBox._ARROW_WIDTH, h + ChatBox._TEXT_BOX_PADDING[1]
+        w, h = self.get_text_size()
+        box_size = w + ChatBox._TEXT_BOX_PADDING[0] + ChatBox._ARROW_WIDTH, ChatBox.get_approximate_height(h)
         return box_size
 
     @staticmethod
-    def get_box_size(text_msg: str,
-                     font: FreeTypeFont = ImageFont.truetype(FONT_PATH, size=24)) -> Tuple[float, float]:
-        max_width = ChatBox.MAX_BOX_WIDTH
-        lines = ''
-        total_lines = 0
-        for line in text_msg.splitlines(keepends=False):
-            for row in textwrap.wrap(line, width=ChatBox.LETTERS_PER_LINE, replace_whitespace=False):
-                lines += row + '\n'
-                total_lines += 1
+    def get_approximate_height(text_height: float) -> float:
+        return text_height + ChatBox._TEXT_BOX_PADDING[1]
 
-        image = Image.new("RGB", (3000, 3000))
-        draw = ImageDraw.Draw(image)
+    @staticmethod
+    def get_font_path() -> str:
+        return RESOURCES.get_path(ChatBox.FONT_NAME)
 
-        w, h = draw.multiline_textsize(text=text_msg, font=font, spacing=ChatBox._TEXT_SPACING)
+    @staticmethod
+    def get_message_font() -> FreeTypeFont:
+        return RESOURCES.get_font(ChatBox.FONT_NAME, ChatBox.TEXT_MESSAGE_FONT_SIZE)
 
+    @staticmethod
+    def get_datetime_font() -> FreeTypeFont:
+        return RESOURCES.get_font(ChatBox.FONT_NAME, ChatBox.DATETIME_FONT_SIZE)
+
+    @staticmethod
+    def get_max_box_width() -> int:
+        return math.ceil(0.75 * WhatsappPage.get_inner_page_width())
+
+    @staticmethod
+    def clear_caches() -> None:
+        ChatBox._measure_box.cache_clear()
+        WrappedText.of.cache_clear()
+        TextMetrics.for_font.cache_clear()
+        GlyphAtlas.for_font.cache_clear()
+
+    @staticmethod
+    def wrap(text_msg: str) -> WrappedText:
+        return WrappedText.of(text_msg, ChatBox.LETTERS_PER_LINE)
+
+    @staticmethod
+    def get_box_size(text_msg: str, font: Optional[FreeTypeFont] = None) -> Tuple[float, float]:
+        font = font or ChatBox.get_message_font()
+        return ChatBox._measure_box(text_msg, font.path, font.size)
+
+    @staticmethod
+    @lru_cache(maxsize=MEASURE_CACHE_SIZE)
+    def _measure_box(text_msg: str, font_path: str, font_size: int) -> Tuple[float, float]:
+        metrics = TextMetrics.for_font(font_path, font_size)
+        w, h = metrics.multiline_size(text_msg, ChatBox._TEXT_SPACING)
+        return ChatBox._fit_box(w, h, len(ChatBox.wrap(text_msg)))
+
+    @staticmethod
+    def _fit_box(w: int, h: int, total_lines: int) -> Tuple[float, float]:
+        max_width = ChatBox.get_max_box_width()
         if w > max_width:
             width_bars = math.ceil(w / max_width)
             # height * width_bars + (line spacing * lines) + padding
@@ -105,26 +176,92 @@ class ChatBox(WhatsappPageElement):
         else:
             return w, h + (total_lines * ChatBox._TEXT_SPACING) + 10
 
+    @staticmethod
+    def split_message(text_msg: str, max_height: int, font: Optional[FreeTypeFont] = None) -> List[str]:
+        # Grows each part one wrapped row at a time, measuring it the way `get_box_size` would measure the
+        # joined rows (each ending in a newline) without re-wrapping or re-measuring the accumulated text
+        font = font or ChatBox.get_message_font()
+        metrics = TextMetrics.for_font(font.path, font.size)
+        line_step = metrics.line_height + ChatBox._TEXT_SPACING
+        rows = ChatBox.wrap(text_msg).rows
+        smaller_messages = []
+        part_start, part_width = 0, 0
+        for idx, row in enumerate(rows):
+            row_width = metrics.line_width(row)
+            part_rows = idx - part_start + 1
+            # The trailing newline adds an empty line to the measured height but not a wrapped row
+            estimated_height = ChatBox._fit_box(max(part_width, row_width), (part_rows + 1) * line_step
+                                                - ChatBox._TEXT_SPACING, part_rows)[1]
+            if estimated_height < max_height:
+                part_width = max(part_width, row_width)
+                continue
+            smaller_messages.append(''.join(part_row + '\n' for part_row in rows[part_start:idx]))
+            part_start, part_width = idx, row_width
+
+        if part_start < len(rows):
+            smaller_messages.append(''.join(part_row + '\n' for part_row in rows[part_start:]))
+        return smaller_messages
+
     def get_formatted_time_text(self) -> str:
         timestamp = self.text_msg.delivery_time
         return timestamp.strftime('%H:%M')
 
     def _add_pointer(self, img: Image) -> Image:
         img = img.convert('RGBA')
-        pointer = 'arrow-right' if self.text_msg.sender.value == Participants.main_participant() else 'arrow-left'
-        file_name = f'{constants.RESOURCES_PATH}/{pointer}.png'
-        pointer_img = Image.open(file_name, 'r').convert('RGBA')
-        bg_w, bg_h = pointer_img.size
-        img_w, img_h = img.size
-
-        offset = (img_w, 0) if self.text_msg.sender.value == Participants.main_participant() else (0, 0)
-
-        new_size = img_w + bg_w, img_h
-        layer = Image.new('RGBA', new_size, (255, 255, 255, 0))
-        layer.paste(img, tuple(map(lambda x: math.ceil((x[0] - x[1]) / 2), zip(new_size, img.size))))
-        layer.paste(pointer_img, offset, pointer_img)
+        pointer_img = self.get_pointer_sprite()
+        layer = Image.new('RGBA', self.get_layer_size(), (255, 255, 255, 0))
+        bubble_offset, pointer_offset = self.get_layer_offsets()
+        layer.paste(img, (bubble_offset, 0))
+        layer.paste(pointer_img, (pointer_offset, 0), pointer_img)
         return layer
 
+    def get_pointer_sprite(self) -> Image:
+        pointer = 'arrow-right' if self.text_msg.sender.align_right else 'arrow-left'
+        return SpriteCache.load(ChatBox.get_pointer_path(pointer), 'RGBA')
+
+    def get_layer_offsets(self) -> Tuple[int, int]:
+        # Horizontal offsets of the bubble and of its pointer in the element's image
+        if self.consecutive_msg:
+            return 0, 0
+        bubble_w = self.get_bubble()[0][0]
+        pointer_w = self.get_pointer_sprite().size[0]
+        return math.ceil(pointer_w / 2), (bubble_w if self.text_msg.sender.align_right else 0)
+
+    def get_layer_size(self) -> Tuple[int, int]:
+        # Size of the element's image (the bubble plus its pointer) without rendering it
+        bubble_w, bubble_h = self.get_bubble()[0]
+        if self.consecutive_msg:
+            return bubble_w, bubble_h
+        return bubble_w + self.get_pointer_sprite().size[0], bubble_h
+
+    @staticmethod
+    def get_pointer_path(pointer: str) -> str:
+        return RESOURCES.get_path(f'{pointer}.png')
+
+    @staticmethod
+    def preload() -> None:
+        ChatBox.get_message_font()
+        ChatBox.get_datetime_font()
+        for pointer in ('arrow-left', 'arrow-right'):
+            SpriteCache.load(ChatBox.get_pointer_path(pointer), 'RGBA')
+
+    @staticmethod
+    def get_asset_paths() -> List[str]:
+        return [ChatBox.get_font_path(), ChatBox.get_pointer_path('arrow-left'),
+                ChatBox.get_pointer_path('arrow-right')]
+
+    @staticmethod
+    def get_render_settings() -> Dict[str, object]:
+        return {
+            'border_radius': ChatBox._BORDER_RADIUS,
+            'arrow_width': ChatBox._ARROW_WIDTH,
+            'text_spacing': ChatBox._TEXT_SPACING,
+            'text_box_padding': ChatBox._TEXT_BOX_PADDING,
+            'margins': (ChatBox.MIN_MARGIN, ChatBox.MAX_MARGIN),
+            'letters_per_line': ChatBox.LETTERS_PER_LINE,
+            'font_sizes': (ChatBox.TEXT_MESSAGE_FONT_SIZE, ChatBox.DATETIME_FONT_SIZE),
+        }
+
     def get_occupied_size(self) -> Tuple[int, int]:
         if self.rendered:
             w, h = self.img.size
@@ -144,25 +281,31 @@ class ChatBox(WhatsappPageElement):
         else:
             raise Exception('Image not rendered')
 
+    @METRICS.timer('chat_box.render_to_page')
     def render_to_page(self, page: WhatsappPage, element_number: int, curr_height_offset: int) -> int:
-        if not self.rendered:
-            self.render()
         h_offset = WhatsappPage.INIT_COORDINATES[0]
         v_offset = curr_height_offset
-        w, h = WhatsappPage.PAGE_SIZE
-        if self.text_msg.sender.value == Participants.main_participant():
-            h_offset = w - self.get_occupied_size()[0] - h_offset
+        w, h = WhatsappPage.get_page_size()
+        layer_w, layer_h = self.get_layer_size()
+        if self.text_msg.sender.align_right:
+            h_offset = w - layer_w - h_offset
             h_offset -= (ChatBox._ARROW_WIDTH if self.consecutive_msg else 0)
         else:
             h_offset += (ChatBox._ARROW_WIDTH if self.consecutive_msg else 0)
         if element_number > 0:
             v_offset += (ChatBox.MIN_MARGIN if self.consecutive_msg else ChatBox.MAX_MARGIN)
-        page.img.paste(self.img, (h_offset, v_offset), self.img)
+        page.draw_chat_box(self, (h_offset, v_offset))
 
-        return v_offset + self.get_simple_height()
+        # The page owns the pixels now; drop the bubble so pages don't keep every rendered box alive
+        self.img, self.rendered = None, False
+        return v_offset + layer_h
 
     def get_type(self):
         return WhatsappPageElement.ElementType.CHAT_OBJECT
 
     def __len__(self) -> int:
         return self.get_occupied_height()
+
+
+METRICS.register_cache('chat_box.measure', ChatBox._measure_box)
+METRICS.register_cache('chat_box.wrap', WrappedText.of)
@@ -0,0 +1,120 @@
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+from instrumentation.metrics import METRICS
+
+# Glyphs that depend on their neighbours (marks, joiners, right-to-left scripts) are left to FreeType
+_SHAPED_CATEGORIES = frozenset(('Mn', 'Mc', 'Me', 'Cf'))
+_SHAPED_BIDI_CLASSES = frozenset(('R', 'AL', 'AN'))
+_ANCHORS = frozenset((None, 'la', 'ls', 'ra', 'rs'))
+
+
+class GlyphAtlas:
+    """
+    Coverage tiles of a font's glyphs, each rasterized once, and text rows composed from them the way FreeType's
+    basic layout draws a row: glyphs placed at their integer advances, overlapping tiles keeping the larger coverage.
+
+    Tiles are coverage only, so one atlas serves every ink colour. Text with colour glyphs, fractional advances or
+    characters needing shaping is not composed (`get_mask` returns None) and has to be drawn by FreeType.
+    """
+    ROW_CACHE_SIZE: int = 1 << 9
+
+    def __init__(self, font: FreeTypeFont) -> None:
+        self.font = font
+        self.ascent: int = font.getmetrics()[0]
+        # char -> (tile, x offset, y offset, advance, bottom) or None if FreeType has to draw it
+        self._glyphs: Dict[str, Optional[Tuple[Image.Image, int, int, int, int]]] = {}
+        self._row_mask = lru_cache(maxsize=GlyphAtlas.ROW_CACHE_SIZE)(self._compose_row)
+        METRICS.register_cache(f'glyph_atlas.rows.{font.size}', self._row_mask)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def for_font(font_path: str, size: int) -> 'GlyphAtlas':
+        return GlyphAtlas(ImageFont.truetype(font_path, size=size))
+
+    def get_mask(self, text: str, anchor: Optional[str] = None) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+        # Coverage of `text` as `ImageDraw.text` would draw it, with its offset from the text position
+        if anchor not in _ANCHORS:
+            return None
+        row = self._row_mask(text)
+        if row is None:
+            return None
+        mask, (x, y), length = row
+        if anchor is not None:
+            x -= length if anchor[0] == 'r' else 0
+            y -= self.ascent if anchor[1] == 's' else 0
+        return mask, (x, y)
+
+    def get_height(self, text: str) -> Optional[int]:
+        # Same as `font.getsize(text)[1]`
+        glyphs = self._get_glyphs(text)
+        if glyphs is None:
+            return None
+        return max((glyph[4] for glyph in glyphs), default=0)
+
+    def _get_glyphs(self, text: str) -> Optional[List[Tuple[Image.Image, int, int, int, int]]]:
+        glyphs = []
+        for char in text:
+            if char not in self._glyphs:
+                self._glyphs[char] = self._rasterize(char)
+            glyph = self._glyphs[char]
+            if glyph is None:
+                return None
+            glyphs.append(glyph)
+        return glyphs
+
+    def _rasterize(self, char: str) -> Optional[Tuple[Image.Image, int, int, int, int]]:
+        if unicodedata.category(char) in _SHAPED_CATEGORIES or \
+                unicodedata.bidirectional(char) in _SHAPED_BIDI_CLASSES:
+            return None
+        advance = self.font.getlength(char)
+        if not advance.is_integer():
+            return None
+        x0, y0, x1, y1 = self.font.getbbox(char)
+        tile = Image.new('L', (max(x1 - x0, 0), max(y1 - y0, 0)))
+        if tile.width and tile.height:
+            ImageDraw.Draw(tile).text((-x0, -y0), char, font=self.font, fill=255)
+            # Drawn in white on transparent black, a monochrome glyph has the same value in every band
+            coloured = Image.new('RGBA', tile.size)
+            ImageDraw.Draw(coloured).text((-x0, -y0), char, font=self.font, fill='white', embedded_color=True)
+            bands = coloured.split()
+            if any(ImageChops.difference(band, tile).getbbox() for band in bands):
+                return None
+        return tile, x0, y0, int(advance), y1
+
+    def _compose_row(self, text: str) -> Optional[Tuple[Image.Image, Tuple[int, int], int]]:
+        glyphs = self._get_glyphs(text)
+        if glyphs is None:
+            return None
+        placed, pen = [], 0
+        for tile, x_offset, y_offset, advance, _ in glyphs:
+            if tile.width and tile.height:
+                placed.append((tile, pen + x_offset, y_offset))
+            pen += advance
+        if not placed:
+            return Image.new('L', (1, 1)), (0, 0), pen
+
+        left = min(x for _, x, _ in placed)
+        top = min(y for _, _, y in placed)
+        size = max(x + tile.width for tile, x, _ in placed) - left, max(y + tile.height for tile, _, y in placed) - top
+        # Tiles are pasted into as few layers as keep them from overlapping, and the layers are then merged
+        # keeping the larger coverage
+        layers: List[List] = []
+        for tile, x, y in placed:
+            layer = next((layer for layer in layers if layer[1] <= x), None)
+            if layer is None:
+                layer = [Image.new('L', size), x]
+                layers.append(layer)
+            layer[0].paste(tile, (x - left, y - top))
+            layer[1] = x + tile.width
+        mask = layers[0][0]
+        for layer, _ in layers[1:]:
+            mask = ImageChops.lighter(mask, layer)
+        return mask, (left, top), pen
+
+    def __repr__(self) -> str:
+        return f'GlyphAtlas ({self.font.getname()[0]} {self.font.size}px, {len(self._glyphs)} glyphs)'
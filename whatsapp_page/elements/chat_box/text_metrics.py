@@ -0,0 +1,48 @@
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from PIL import ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+
+class TextMetrics:
+    """
+    Render-free text measurement matching `ImageDraw.multiline_textsize` for a single font.
+
+    Printable ASCII lines are measured from cached glyph metrics (the chat font is monospace), anything
+    else falls back to FreeType with the result cached per line.
+    """
+    FAST_PATH_CHARS: str = ''.join(map(chr, range(32, 127)))
+    FALLBACK_CACHE_SIZE: int = 1 << 14
+
+    def __init__(self, font: FreeTypeFont) -> None:
+        self.font = font
+        self.line_height: int = font.getsize('A')[1]
+        self._glyph_extents: Dict[str, int] = {char: font.getsize(char)[0] for char in TextMetrics.FAST_PATH_CHARS}
+        advances = {font.getlength(char) for char in TextMetrics.FAST_PATH_CHARS}
+        self._advance: int = int(advances.pop()) if len(advances) == 1 else 0
+        # Only the last glyph can overhang the pen position if no glyph overhangs by more than one advance
+        self._fast_path: bool = not advances and self._advance > 0 and \
+            max(self._glyph_extents.values()) <= 2 * self._advance
+        self._freetype_width = lru_cache(maxsize=TextMetrics.FALLBACK_CACHE_SIZE)(self._measure_with_freetype)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def for_font(font_path: str, size: int) -> 'TextMetrics':
+        return TextMetrics(ImageFont.truetype(font_path, size=size))
+
+    def line_width(self, line: str) -> int:
+        if not line:
+            return 0
+        if self._fast_path and line.isascii() and line.isprintable():
+            advance = self._advance
+            return max(len(line) * advance, (len(line) - 1) * advance + self._glyph_extents[line[-1]])
+        return self._freetype_width(line)
+
+    def multiline_size(self, text: str, spacing: int) -> Tuple[int, int]:
+        lines = text.split('\n')
+        width = max(self.line_width(line) for line in lines)
+        return width, len(lines) * (self.line_height + spacing) - spacing
+
+    def _measure_with_freetype(self, line: str) -> int:
+        return self.font.getsize(line)[0]
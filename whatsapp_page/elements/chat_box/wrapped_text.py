@@ -0,0 +1,47 @@
+import textwrap
+from functools import lru_cache
+from typing import List
+
+from PIL.ImageFont import FreeTypeFont
+
+from whatsapp_page.elements.chat_box.glyph_atlas import GlyphAtlas
+
+
+class WrappedText:
+    """
+    A message wrapped once into display rows. Each row remembers which source line it came from, since a
+    row is drawn with the pixel height of its whole source line; splitting, measuring and drawing all read these rows.
+    """
+    WRAP_CACHE_SIZE: int = 1 << 12
+
+    __slots__ = ('text', 'lines', 'rows', 'row_lines')
+
+    def __init__(self, text: str, width: int) -> None:
+        self.text = text
+        self.lines: List[str] = text.splitlines(keepends=False)
+        self.rows: List[str] = []
+        self.row_lines: List[int] = []
+        for line_idx, line in enumerate(self.lines):
+            for row in textwrap.wrap(line, width=width, replace_whitespace=False):
+                self.rows.append(row)
+                self.row_lines.append(line_idx)
+
+    @staticmethod
+    @lru_cache(maxsize=WRAP_CACHE_SIZE)
+    def of(text: str, width: int) -> 'WrappedText':
+        return WrappedText(text, width)
+
+    def row_heights(self, font: FreeTypeFont) -> List[int]:
+        line_heights = {}
+        for line_idx in self.row_lines:
+            if line_idx not in line_heights:
+                line = self.lines[line_idx]
+                line_height = GlyphAtlas.for_font(font.path, font.size).get_height(line)
+                line_heights[line_idx] = line_height if line_height is not None else font.getsize(line)[1]
+        return [line_heights[line_idx] for line_idx in self.row_lines]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __repr__(self) -> str:
+        return f'WrappedText ({len(self.lines)} lines, {len(self.rows)} rows)'
@@ -1,12 +1,15 @@
-from copy import copy
 from datetime import datetime
-from typing import Tuple
+from functools import lru_cache
+from typing import Dict, List, Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from PIL.ImageFont import FreeTypeFont
 
+from instrumentation.metrics import METRICS
 from whatsapp_page.elements.chat_box.chat_box import ChatBox
 from whatsapp_page.elements.page_elements import WhatsappPageElement
+from whatsapp_page.resource_manager import RESOURCES
+from whatsapp_page.sprite_cache import SpriteCache
 from whatsapp_page.whatsapp_page import WhatsappPage
 
 
@@ -16,31 +19,66 @@ class DateLabel(WhatsappPageElement):
     _BORDER_RADIUS: int = 10
     _LABEL_COLOR: Tuple[int, int, int] = (24, 34, 41)
     _LABEL_TEXT_COLOR: Tuple[int, int, int] = 130, 152, 168
-    _LABEL_BOX: Image = Image.new(size=LABEL_SIZE, mode='RGBA')
-    _LABEL_FONT: FreeTypeFont = ImageFont.truetype(ChatBox.FONT_PATH, size=18)
+    _LABEL_FONT_SIZE: int = 18
+    LABEL_CACHE_SIZE: int = 4096
+
+    __slots__ = ('date_obj', 'date_str')
 
     def __init__(self, date_obj: datetime):
         self.date_obj = date_obj
         self.date_str = self.get_formatted_datetime()
 
     def render(self):
-        text_box = copy(DateLabel._LABEL_BOX)
+        return DateLabel.render_label(self.date_str)
+
+    @staticmethod
+    @lru_cache(maxsize=LABEL_CACHE_SIZE)
+    def render_label(date_str: str) -> Image:
+        text_box = DateLabel.get_label_plate().copy()
         draw = ImageDraw.Draw(text_box)
 
         x1 = DateLabel.LABEL_SIZE[0]
         y1 = DateLabel.LABEL_SIZE[1]
-        draw.rounded_rectangle((0, 0, x1, y1), fill=DateLabel._LABEL_COLOR, radius=DateLabel._BORDER_RADIUS)
-        w, h = draw.textsize(self.date_str, font=DateLabel._LABEL_FONT)
-        draw.text(((x1 - w) // 2, (y1 - h) // 2), self.date_str, font=DateLabel._LABEL_FONT,
+        font = DateLabel.get_label_font()
+        w, h = draw.textsize(date_str, font=font)
+        draw.text(((x1 - w) // 2, (y1 - h) // 2), date_str, font=font,
                   fill=DateLabel._LABEL_TEXT_COLOR)
         return text_box
 
+    @staticmethod
+    def get_label_plate() -> Image:
+        return SpriteCache.rounded_plate(DateLabel.LABEL_SIZE, DateLabel._LABEL_COLOR, DateLabel._BORDER_RADIUS)
+
+    @staticmethod
+    def get_label_font() -> FreeTypeFont:
+        return RESOURCES.get_font(ChatBox.FONT_NAME, DateLabel._LABEL_FONT_SIZE)
+
+    @staticmethod
+    def preload() -> None:
+        DateLabel.get_label_font()
+        DateLabel.get_label_plate()
+
+    @staticmethod
+    def get_asset_paths() -> List[str]:
+        return [ChatBox.get_font_path()]
+
+    @staticmethod
+    def get_render_settings() -> Dict[str, object]:
+        return {
+            'label_margin': DateLabel.LABEL_MARGIN,
+            'label_size': DateLabel.LABEL_SIZE,
+            'border_radius': DateLabel._BORDER_RADIUS,
+            'colors': (DateLabel._LABEL_COLOR, DateLabel._LABEL_TEXT_COLOR),
+            'font_size': DateLabel._LABEL_FONT_SIZE,
+        }
+
+    @METRICS.timer('date_label.render_to_page')
     def render_to_page(self, page: WhatsappPage, element_number: int, curr_height_offset: int) -> int:
         text_box = self.render()
-        w, h = WhatsappPage.PAGE_SIZE
+        w, h = WhatsappPage.get_page_size()
         v_offset = curr_height_offset + DateLabel.LABEL_MARGIN
         h_offset = (w - DateLabel.LABEL_SIZE[0]) // 2
-        page.img.paste(text_box, (h_offset, v_offset), text_box)
+        page.paste(text_box, (h_offset, v_offset))
 
         return v_offset + self.get_simple_height() + DateLabel.LABEL_MARGIN
 
@@ -59,3 +97,6 @@ class DateLabel(WhatsappPageElement):
 
     def __len__(self):
         return self.get_occupied_height()
+
+
+METRICS.register_cache('date_label.render_label', DateLabel.render_label)
@@ -5,6 +5,7 @@ from whatsapp_page.whatsapp_page import WhatsappPage
 
 
 class WhatsappPageElement:
+    __slots__ = ()
     MAX_ELEMENT_HEIGHT = 600
 
     class ElementType(Enum):
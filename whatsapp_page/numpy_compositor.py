@@ -0,0 +1,197 @@
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+from PIL.ImageFont import FreeTypeFont
+
+from instrumentation.metrics import METRICS
+from whatsapp_page.elements.chat_box.glyph_atlas import GlyphAtlas
+from whatsapp_page.page_compositor import PageCompositor
+
+_Clip = Tuple[slice, slice, slice, slice]
+
+
+class NumpyCompositor(PageCompositor):
+    """
+    Builds the page as an RGBA `numpy` array. Bubbles are filled straight into it through a cached shape mask,
+    glyph masks are rendered once per distinct text and blended in, and pointers and sprites are alpha blended
+    over their region only, with Pillow's rounding so the pixels match the Pillow backend.
+    """
+    name: str = 'numpy'
+    TEXT_CACHE_SIZE: int = 1 << 12
+    MASK_CACHE_SIZE: int = 256
+    SPRITE_CACHE_SIZE: int = 256
+
+    def __init__(self) -> None:
+        self._text_tile = lru_cache(maxsize=NumpyCompositor.TEXT_CACHE_SIZE)(self._render_text_tile)
+        self._bubble_mask = lru_cache(maxsize=NumpyCompositor.MASK_CACHE_SIZE)(self._build_bubble_mask)
+        self._sprites: Dict[int, Tuple[Image.Image, np.ndarray]] = {}
+        METRICS.register_cache('numpy_compositor.text_tile', self._text_tile)
+        METRICS.register_cache('numpy_compositor.bubble_mask', self._bubble_mask)
+
+    def _sprite_array(self, img: Image) -> np.ndarray:
+        # Sprites come from process-wide caches and are never drawn on, so their pixels are keyed by identity;
+        # holding on to the image keeps its id from being reused
+        sprite = self._sprites.get(id(img))
+        if sprite is None:
+            if len(self._sprites) >= NumpyCompositor.SPRITE_CACHE_SIZE:
+                self._sprites.clear()
+            sprite = self._sprites[id(img)] = img, np.asarray(img)
+        return sprite[1]
+
+    def new_canvas(self, background: Image) -> np.ndarray:
+        return np.array(self._sprite_array(background))
+
+    def paste(self, canvas: np.ndarray, img: Image, xy: Tuple[int, int]) -> None:
+        sprite = self._sprite_array(img)
+        clip = NumpyCompositor._clip(canvas, xy, sprite.shape)
+        if clip is not None:
+            rows, cols, src_rows, src_cols = clip
+            NumpyCompositor.blend(canvas[rows, cols], sprite[src_rows, src_cols], sprite[src_rows, src_cols, 3:])
+
+    @METRICS.timer('numpy_compositor.draw_chat_box')
+    def draw_chat_box(self, canvas: np.ndarray, chat_box: 'ChatBox', xy: Tuple[int, int]) -> None:
+        box_size, box_rect, radius = chat_box.get_bubble()
+        bubble_offset, pointer_offset = chat_box.get_layer_offsets()
+        bubble_xy = xy[0] + bubble_offset, xy[1]
+        pointer_clip = pointer = under_pointer = None
+        if not chat_box.consecutive_msg:
+            # The pointer is blended over what was on the page before the bubble, so keep that part
+            pointer = self._sprite_array(chat_box.get_pointer_sprite())
+            pointer_clip = NumpyCompositor._clip(canvas, (xy[0] + pointer_offset, xy[1]), pointer.shape)
+            if pointer_clip is not None:
+                under_pointer = canvas[pointer_clip[0], pointer_clip[1]].copy()
+
+        bubble_mask = self._bubble_mask(box_size, box_rect, radius)
+        bubble_clip = NumpyCompositor._clip(canvas, bubble_xy, bubble_mask.shape)
+        if bubble_clip is None:
+            return
+        rows, cols, src_rows, src_cols = bubble_clip
+        bubble = canvas[rows, cols]
+        # Filled a whole pixel (one uint32) at a time, which is far cheaper than four broadcast channels
+        np.copyto(NumpyCompositor._pixels(bubble), NumpyCompositor._pixel(chat_box.box_color + (255,)),
+                  where=bubble_mask[src_rows, src_cols])
+
+        ink = ImageColor.getcolor(chat_box.TEXT_COLOR, 'RGBA')
+        for text_xy, text, font, anchor, embedded_color in chat_box.get_text_items():
+            color, mask, offset = self._text_tile(text, font, anchor, embedded_color, ink)
+            # Glyphs are clipped to the bubble like they are when drawn into the bubble's own image
+            text_clip = NumpyCompositor._clip(bubble, (text_xy[0] + offset[0] - src_cols.start,
+                                                       text_xy[1] + offset[1] - src_rows.start), mask.shape)
+            if text_clip is not None:
+                text_rows, text_cols, glyph_rows, glyph_cols = text_clip
+                glyph_color = color[glyph_rows, glyph_cols] if color.ndim == 3 else color
+                NumpyCompositor.blend(bubble[text_rows, text_cols], glyph_color, mask[glyph_rows, glyph_cols, None])
+
+        if pointer_clip is not None:
+            self._blend_pointer(canvas, pointer, pointer_clip, under_pointer, bubble_mask,
+                                pointer_offset - bubble_offset)
+
+    @staticmethod
+    def _blend_pointer(canvas: np.ndarray, pointer: np.ndarray, pointer_clip: _Clip, under_pointer: np.ndarray,
+                       bubble_mask: np.ndarray, bubble_x: int) -> None:
+        # Replays the Pillow path on the pointer's region: the pointer is pasted onto the element's image (the
+        # bubble's image, transparent black around its corners, on transparent white) and that is then pasted
+        # onto the page
+        rows, cols, src_rows, src_cols = pointer_clip
+        region = canvas[rows, cols]
+        layer = np.empty(region.shape, dtype=np.uint8)
+        layer[...] = (255, 255, 255, 0)
+        mask_cols = np.arange(src_cols.start, src_cols.stop) + bubble_x
+        in_bubble = (mask_cols >= 0) & (mask_cols < bubble_mask.shape[1])
+        bubble_rows = max(0, min(layer.shape[0], bubble_mask.shape[0] - src_rows.start))
+        layer[:bubble_rows, in_bubble] = 0
+        covered = np.zeros(layer.shape[:2], dtype=bool)
+        covered[:bubble_rows, in_bubble] = bubble_mask[src_rows.start:src_rows.start + bubble_rows,
+                                                       mask_cols[in_bubble]]
+        layer[covered] = region[covered]
+
+        sprite = pointer[src_rows, src_cols]
+        NumpyCompositor.blend(layer, sprite, sprite[..., 3:])
+        region[...] = under_pointer
+        NumpyCompositor.blend(region, layer, layer[..., 3:])
+
+    def to_image(self, canvas: np.ndarray) -> Image:
+        return Image.fromarray(canvas, 'RGBA')
+
+    @staticmethod
+    def _pixels(rgba: np.ndarray) -> np.ndarray:
+        return rgba.view(np.uint32)[..., 0]
+
+    @staticmethod
+    def _pixel(rgba: Tuple[int, int, int, int]) -> np.uint32:
+        return np.array(rgba, dtype=np.uint8).view(np.uint32)[0]
+
+    @staticmethod
+    def blend(dest: np.ndarray, src: np.ndarray, mask: np.ndarray) -> None:
+        # In place `dest = src * mask + dest * (255 - mask)` with the rounding of Pillow's paste; every
+        # intermediate stays below 2 ** 16
+        mask = mask.astype(np.uint16)
+        blended = dest * (255 - mask) + src * mask + 128
+        dest[...] = ((blended >> 8) + blended) >> 8
+
+    @staticmethod
+    def _clip(canvas: np.ndarray, xy: Tuple[int, int], shape: Tuple[int, ...]) -> Optional[_Clip]:
+        # Destination and source slices of a `shape` sized sprite placed at `xy`, or None if nothing is visible
+        x, y = xy
+        height, width = shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, canvas.shape[1]), min(y + height, canvas.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return slice(y0, y1), slice(x0, x1), slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)
+
+    @staticmethod
+    def _render_text_tile(text: str, font: FreeTypeFont, anchor: Optional[str], embedded_color: bool,
+                          ink: Tuple[int, int, int, int]) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+        # Renders the glyphs the way `ImageDraw.text` does for an integer position on an RGBA image and
+        # returns (colour, coverage mask, offset from the text position)
+        glyphs = GlyphAtlas.for_font(font.path, font.size).get_mask(text, anchor)
+        if glyphs is not None:
+            # Atlas glyphs are monochrome: the same coverage in both modes, all of it ink
+            mask, offset = glyphs
+            return np.array(ink, dtype=np.uint8), np.asarray(mask), offset
+
+        mode = 'RGBA' if embedded_color else 'L'
+        ink_value = int.from_bytes(bytes(ink), 'little')
+        glyphs, offset = font.getmask2(text, mode, anchor=anchor, ink=ink_value, start=(0, 0))
+        glyphs = np.array(Image.Image()._new(glyphs))
+        if mode == 'RGBA':
+            # Colour glyphs come with their colour in RGB and coverage in alpha; the text itself is opaque
+            mask = glyphs[..., 3].copy()
+            glyphs[..., 3] = ink[3]
+            return glyphs, mask, offset
+        return np.array(ink, dtype=np.uint8), glyphs, offset
+
+    @staticmethod
+    def _build_bubble_mask(box_size: Tuple[int, int], box_rect: Tuple[int, int, int, int],
+                           radius: int) -> np.ndarray:
+        # Solid rectangle with the four corner squares taken from a rounded rectangle drawn by Pillow, so the
+        # corners are rasterised exactly like `ImageDraw.rounded_rectangle` draws them
+        corners = NumpyCompositor._corner_mask(radius)
+        x0, y0, x1, y1 = box_rect
+        shape = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=bool)
+        shape[...] = True
+        side = radius + 1
+        shape[:side, :side] = corners[:side, :side]
+        shape[:side, -side:] = corners[:side, -side:]
+        shape[-side:, :side] = corners[-side:, :side]
+        shape[-side:, -side:] = corners[-side:, -side:]
+
+        mask = np.zeros((box_size[1], box_size[0]), dtype=bool)
+        clip = NumpyCompositor._clip(mask, (x0, y0), shape.shape)
+        if clip is not None:
+            rows, cols, src_rows, src_cols = clip
+            mask[rows, cols] = shape[src_rows, src_cols]
+        mask.setflags(write=False)
+        return mask
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _corner_mask(radius: int) -> np.ndarray:
+        # Large enough that Pillow draws real corners rather than an ellipse
+        size = 4 * radius + 3
+        img = Image.new('L', (size, size))
+        ImageDraw.Draw(img).rounded_rectangle((0, 0, size - 1, size - 1), fill=255, radius=radius)
+        return np.asarray(img) > 0
@@ -0,0 +1,60 @@
+import io
+from typing import BinaryIO, Dict, Optional, Union
+
+from PIL import Image
+
+import constants
+
+
+class OutputFormat:
+    """An encoder preset for rendered pages: Pillow format, save options and optional palette quantisation."""
+
+    def __init__(self, name: str, pil_format: str, extension: str, mode: str = 'RGBA',
+                 palette_colors: Optional[int] = None, **save_options) -> None:
+        self.name = name
+        self.pil_format = pil_format
+        self.extension = extension
+        self.mode = mode
+        self.palette_colors = palette_colors
+        self.save_options = save_options
+
+    def prepare(self, img: Image) -> Image:
+        if self.palette_colors is not None:
+            # The chat UI only uses a handful of colours, so an adaptive palette is close to lossless
+            return img.convert('RGB').quantize(colors=self.palette_colors, method=Image.Quantize.FASTOCTREE)
+        if img.mode != self.mode:
+            return img.convert(self.mode)
+        return img
+
+    def save(self, img: Image, fp: Union[str, BinaryIO]) -> None:
+        self.prepare(img).save(fp, format=self.pil_format, **self.save_options)
+
+    def encode(self, img: Image) -> bytes:
+        buffer = io.BytesIO()
+        self.save(img, buffer)
+        return buffer.getvalue()
+
+    def get_settings(self) -> Dict[str, object]:
+        return {'name': self.name, 'format': self.pil_format, 'mode': self.mode,
+                'palette_colors': self.palette_colors, 'options': self.save_options}
+
+    @staticmethod
+    def get(name: Optional[str] = None) -> 'OutputFormat':
+        name = name or constants.OUTPUT_FORMAT
+        if name not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format {name!r}, expected one of {", ".join(OUTPUT_FORMATS)}')
+        return OUTPUT_FORMATS[name]
+
+    def __repr__(self) -> str:
+        return f'OutputFormat {self.name} ({self.pil_format})'
+
+
+OUTPUT_FORMATS: Dict[str, OutputFormat] = {output_format.name: output_format for output_format in [
+    OutputFormat('png', 'png', 'png'),
+    OutputFormat('png-fast', 'png', 'png', compress_level=1),
+    OutputFormat('png-small', 'png', 'png', compress_level=9, optimize=True),
+    OutputFormat('png-palette', 'png', 'png', palette_colors=256, compress_level=6),
+    OutputFormat('webp', 'webp', 'webp', mode='RGB', quality=90, method=4),
+    OutputFormat('webp-lossless', 'webp', 'webp', mode='RGB', lossless=True, quality=50, method=2),
+    OutputFormat('jpeg', 'jpeg', 'jpg', mode='RGB', quality=90, optimize=True),
+]}
@@ -0,0 +1,182 @@
+import json
+import os
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from instrumentation.metrics import METRICS
+from whatsapp_page.output_format import OutputFormat
+
+# (PDF stream filter, width, height, stream data) for one page
+PdfPagePayload = Tuple[str, int, int, bytes]
+
+
+class PageBundleWriter:
+    """
+    Base class for writers that collect many rendered pages into a few files. Pages must be added in
+    page order; an index mapping page numbers to their file, byte offset and bounding box is written on close.
+    """
+    INDEX_FILE_NAME: str = 'index.json'
+
+    def __init__(self, output_path: str) -> None:
+        self.output_path = output_path
+        self.index: Dict[int, Dict[str, object]] = {}
+        os.makedirs(output_path, exist_ok=True)
+
+    def add_page(self, page_number: int, payload: object) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        with open(os.path.join(self.output_path, PageBundleWriter.INDEX_FILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump({str(page_number): entry for page_number, entry in self.index.items()}, f, indent=1)
+
+    def __enter__(self) -> 'PageBundleWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class PdfBundleWriter(PageBundleWriter):
+    """
+    Streams pages into one multi-page PDF. Each page is a single image XObject written as soon as it
+    arrives; only object offsets are kept in memory, and the page tree and xref table are written on close.
+    """
+    FILE_NAME: str = 'chat.pdf'
+    _CATALOG_ID: int = 1
+    _PAGES_ID: int = 2
+
+    def __init__(self, output_path: str) -> None:
+        super().__init__(output_path)
+        self.file_name = os.path.join(output_path, PdfBundleWriter.FILE_NAME)
+        self._file: BinaryIO = open(self.file_name, 'wb')
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = PdfBundleWriter._PAGES_ID + 1
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._write_object(PdfBundleWriter._CATALOG_ID,
+                           f'<< /Type /Catalog /Pages {PdfBundleWriter._PAGES_ID} 0 R >>'.encode('ascii'))
+
+    @staticmethod
+    def encode_page(img: Image, output_format: OutputFormat) -> PdfPagePayload:
+        # JPEG presets are embedded as-is; everything else is stored losslessly as deflated RGB
+        img = img.convert('RGB')
+        if output_format.pil_format == 'jpeg':
+            return 'DCTDecode', img.width, img.height, output_format.encode(img)
+        return 'FlateDecode', img.width, img.height, zlib.compress(img.tobytes(), 6)
+
+    def add_page(self, page_number: int, payload: PdfPagePayload) -> None:
+        stream_filter, width, height, data = payload
+        image_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+
+        image_header = (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB '
+                        f'/BitsPerComponent 8 /Filter /{stream_filter} /Length {len(data)} >>').encode('ascii')
+        data_offset = self._write_object(image_id, image_header, data)
+        content = f'q {width} 0 0 {height} 0 0 cm /Im0 Do Q'.encode('ascii')
+        self._write_object(content_id, f'<< /Length {len(content)} >>'.encode('ascii'), content)
+        self._write_object(page_id, (f'<< /Type /Page /Parent {PdfBundleWriter._PAGES_ID} 0 R '
+                                     f'/MediaBox [0 0 {width} {height}] /Resources << /XObject << /Im0 {image_id} 0 R '
+                                     f'>> >> /Contents {content_id} 0 R >>').encode('ascii'))
+        self._page_ids.append(page_id)
+        self.index[page_number] = {'file': PdfBundleWriter.FILE_NAME, 'offset': data_offset, 'length': len(data),
+                                   'pdf_page': len(self._page_ids), 'bbox': [0, 0, width, height]}
+
+    def close(self) -> None:
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+        self._write_object(PdfBundleWriter._PAGES_ID,
+                           f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>'.encode('ascii'))
+        xref_offset = self._file.tell()
+        self._file.write(f'xref\n0 {self._next_id}\n0000000000 65535 f \n'.encode('ascii'))
+        for object_id in range(1, self._next_id):
+            self._file.write(f'{self._offsets[object_id]:010d} 00000 n \n'.encode('ascii'))
+        self._file.write(f'trailer\n<< /Size {self._next_id} /Root {PdfBundleWriter._CATALOG_ID} 0 R >>\n'
+                         f'startxref\n{xref_offset}\n%%EOF\n'.encode('ascii'))
+        METRICS.increment('bytes_written', self._file.tell())
+        self._file.close()
+        super().close()
+
+    def _write_object(self, object_id: int, dictionary: bytes, stream: Optional[bytes] = None) -> int:
+        # Returns the offset of the stream data (or of the object when it has no stream)
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f'{object_id} 0 obj\n'.encode('ascii') + dictionary)
+        if stream is None:
+            self._file.write(b'\nendobj\n')
+            return self._offsets[object_id]
+        self._file.write(b'\nstream\n')
+        stream_offset = self._file.tell()
+        self._file.write(stream)
+        self._file.write(b'\nendstream\nendobj\n')
+        return stream_offset
+
+
+class SheetBundleWriter(PageBundleWriter):
+    """
+    Tiles pages into sheets, keeping only the sheet being filled in memory. Pages are tiled at full size unless
+    a smaller tile scale is asked for, which makes a contact sheet rather than readable pages. The grid is as
+    many tiles as fit in `MAX_SHEET_SIZE`, up to `GRID` and at least one.
+    """
+    GRID: Tuple[int, int] = (4, 4)
+    # About 50 MB per sheet in memory; full-size pages go 2x2 on a sheet
+    MAX_SHEET_SIZE: Tuple[int, int] = (4096, 4096)
+    TILE_SCALE: float = 1.0
+    BACKGROUND_COLOR: Tuple[int, int, int] = (11, 20, 26)
+
+    def __init__(self, output_path: str, tile_size: Tuple[int, int], output_format: OutputFormat,
+                 grid: Optional[Tuple[int, int]] = None) -> None:
+        super().__init__(output_path)
+        self.tile_size = tile_size
+        self.output_format = output_format
+        self.columns, self.rows = grid or SheetBundleWriter.get_grid(tile_size)
+        self._sheet: Optional[Image.Image] = None
+        self._sheet_number = 0
+        self._tiles_on_sheet = 0
+
+    @staticmethod
+    def get_tile_size(page_size: Tuple[int, int], scale: Optional[float] = None) -> Tuple[int, int]:
+        scale = scale or SheetBundleWriter.TILE_SCALE
+        return max(1, round(page_size[0] * scale)), max(1, round(page_size[1] * scale))
+
+    @staticmethod
+    def get_grid(tile_size: Tuple[int, int]) -> Tuple[int, int]:
+        return tuple(max(1, min(max_tiles, max_size // size)) for max_tiles, max_size, size in
+                     zip(SheetBundleWriter.GRID, SheetBundleWriter.MAX_SHEET_SIZE, tile_size))
+
+    @staticmethod
+    def encode_tile(img: Image, tile_size: Tuple[int, int]) -> bytes:
+        img = img.convert('RGB')
+        if img.size != tile_size:
+            img = img.resize(tile_size, Image.Resampling.BOX)
+        return img.tobytes()
+
+    def add_page(self, page_number: int, payload: bytes) -> None:
+        if self._sheet is None:
+            sheet_size = self.columns * self.tile_size[0], self.rows * self.tile_size[1]
+            self._sheet = Image.new('RGB', sheet_size, SheetBundleWriter.BACKGROUND_COLOR)
+            self._sheet_number += 1
+            self._tiles_on_sheet = 0
+
+        row, column = divmod(self._tiles_on_sheet, self.columns)
+        x0, y0 = column * self.tile_size[0], row * self.tile_size[1]
+        self._sheet.paste(Image.frombytes('RGB', self.tile_size, payload), (x0, y0))
+        self._tiles_on_sheet += 1
+        self.index[page_number] = {'file': self.get_sheet_file_name(self._sheet_number), 'offset': None,
+                                   'bbox': [x0, y0, x0 + self.tile_size[0], y0 + self.tile_size[1]]}
+        if self._tiles_on_sheet == self.columns * self.rows:
+            self._flush()
+
+    def get_sheet_file_name(self, sheet_number: int) -> str:
+        return f'sheet_{sheet_number}.{self.output_format.extension}'
+
+    def close(self) -> None:
+        self._flush()
+        super().close()
+
+    def _flush(self) -> None:
+        if self._sheet is None:
+            return
+        file_name = os.path.join(self.output_path, self.get_sheet_file_name(self._sheet_number))
+        self.output_format.save(self._sheet, file_name)
+        METRICS.increment('bytes_written', os.path.getsize(file_name))
+        self._sheet = None
@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from PIL import Image
+
+import constants
+
+COMPOSITORS: Tuple[str, ...] = ('pillow', 'numpy')
+
+
+class PageCompositor:
+    """
+    Draws the elements of a page into its pixel buffer (the canvas). Every backend must produce the same pixels;
+    `benchmarks/compositor_parity.py` diffs them against the Pillow one.
+    """
+    name: str = None
+
+    def new_canvas(self, background: Image) -> object:
+        raise NotImplementedError()
+
+    def paste(self, canvas: object, img: Image, xy: Tuple[int, int]) -> None:
+        # Pastes an RGBA sprite using its own alpha as the mask
+        raise NotImplementedError()
+
+    def draw_chat_box(self, canvas: object, chat_box: 'ChatBox', xy: Tuple[int, int]) -> None:
+        raise NotImplementedError()
+
+    def to_image(self, canvas: object) -> Image:
+        raise NotImplementedError()
+
+    @staticmethod
+    def get(name: Optional[str] = None) -> 'PageCompositor':
+        return PageCompositor._create(name or constants.COMPOSITOR)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _create(name: str) -> 'PageCompositor':
+        if name == 'pillow':
+            return PillowCompositor()
+        if name == 'numpy':
+            # NumPy is only needed by this backend, so it is imported when the backend is picked
+            from whatsapp_page.numpy_compositor import NumpyCompositor
+            return NumpyCompositor()
+        raise ValueError(f'Unknown compositor {name!r}, expected one of {", ".join(COMPOSITORS)}')
+
+    def __repr__(self) -> str:
+        return f'PageCompositor {self.name}'
+
+
+class PillowCompositor(PageCompositor):
+    """Renders each element to its own RGBA image and pastes it onto the page with `Image.paste`."""
+    name: str = 'pillow'
+
+    def new_canvas(self, background: Image) -> Image:
+        return background.copy()
+
+    def paste(self, canvas: Image, img: Image, xy: Tuple[int, int]) -> None:
+        canvas.paste(img, xy, img)
+
+    def draw_chat_box(self, canvas: Image, chat_box: 'ChatBox', xy: Tuple[int, int]) -> None:
+        img = chat_box.render() if not chat_box.rendered else chat_box.img
+        canvas.paste(img, xy, img)
+
+    def to_image(self, canvas: Image) -> Image:
+        return canvas
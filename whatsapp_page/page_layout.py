@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from models.participants import Participant
+
+
+class PagePlan:
+    """A page break decided by the layout pass: elements `start` (inclusive) to `end` (exclusive)."""
+
+    def __init__(self, page_number: int, start: int, end: int, height: int) -> None:
+        self.page_number = page_number
+        self.start = start
+        self.end = end
+        self.height = height
+
+    def indices(self) -> Iterator[int]:
+        return iter(range(self.start, self.end))
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f'Page {self.page_number} [{self.start}:{self.end}] ({self.height}px)'
+
+
+class PageJob:
+    """
+    Picklable description of one page: (message, delivery time, sender, consecutive, measured size) rows.
+    `target` says whether the worker saves the page itself or hands it back encoded (for a bundle or a caller).
+    """
+    TARGET_FILE: str = 'file'
+    TARGET_BYTES: str = 'bytes'
+    TARGET_PDF: str = 'pdf'
+    TARGET_SHEETS: str = 'sheets'
+
+    def __init__(self, page_number: int,
+                 records: List[Tuple[str, datetime, Participant, bool, Tuple[float, float]]],
+                 output_format: str = 'png', target: str = TARGET_FILE,
+                 tile_size: Optional[Tuple[int, int]] = None, compositor: Optional[str] = None) -> None:
+        self.page_number = page_number
+        self.records = records
+        self.output_format = output_format
+        self.target = target
+        self.tile_size = tile_size
+        self.compositor = compositor
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __repr__(self) -> str:
+        return f'PageJob {self.page_number} ({len(self.records)} messages)'
@@ -0,0 +1,58 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Deque, Generic, Iterator, List, Optional, Set, TypeVar
+
+import constants
+from whatsapp_page.page_layout import PageJob
+
+T = TypeVar('T')
+
+
+class PageRenderPool(Generic[T]):
+    """
+    Renders page jobs on a process pool while keeping at most `max_in_flight` pages queued or rendering,
+    so memory stays flat regardless of how many pages a chat produces. An `ordered` pool hands results
+    back in submission order; pages that finish early count as in flight until everything before them is done.
+    """
+
+    def __init__(self, render_fn: Callable[[PageJob], T], initializer: Optional[Callable[[], None]] = None,
+                 workers: Optional[int] = None, max_in_flight: Optional[int] = None, ordered: bool = False) -> None:
+        self.render_fn = render_fn
+        self.workers = workers or constants.RENDER_WORKERS
+        self.max_in_flight = max(1, max_in_flight or constants.MAX_PAGES_IN_FLIGHT)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initializer)
+        self.ordered = ordered
+        self._in_flight: Set[Future] = set()
+        self._pending: Deque[Future] = deque()
+
+    def __enter__(self) -> 'PageRenderPool[T]':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is not None:
+            for future in [*self._in_flight, *self._pending]:
+                future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def submit(self, job: PageJob) -> List[T]:
+        completed = []
+        if self.ordered:
+            while len(self._pending) >= self.max_in_flight:
+                completed.append(self._pending.popleft().result())
+            self._pending.append(self._executor.submit(self.render_fn, job))
+            return completed
+
+        while len(self._in_flight) >= self.max_in_flight:
+            completed.extend(self._collect())
+        self._in_flight.add(self._executor.submit(self.render_fn, job))
+        return completed
+
+    def drain(self) -> Iterator[T]:
+        while self._pending:
+            yield self._pending.popleft().result()
+        while self._in_flight:
+            yield from self._collect()
+
+    def _collect(self) -> List[T]:
+        done, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+        return [future.result() for future in done]
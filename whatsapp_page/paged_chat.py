@@ -0,0 +1,61 @@
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import constants
+from instrumentation.metrics import METRICS
+from models.chat_store import ChatStore
+from whatsapp_page.page_layout import PagePlan
+from whatsapp_page.whatsapp_page import WhatsappPage
+
+
+class PagedChat:
+    """
+    Lazy sequence of the pages of a chat. Pages are built from their layout plan and rendered only when
+    accessed, and the most recently used `cache_size` rendered pages are kept.
+    """
+
+    def __init__(self, texts: ChatStore, page_plans: List[PagePlan],
+                 page_builder: Callable[[ChatStore, PagePlan], WhatsappPage], cache_size: Optional[int] = None) -> None:
+        self.texts = texts
+        self.page_plans = page_plans
+        self.page_builder = page_builder
+        # A query may select only some of the pages, so page numbers are not positions in `page_plans`
+        self._positions: Dict[int, int] = {page_plan.page_number: idx for idx, page_plan in enumerate(page_plans)}
+        self.cache_size = cache_size if cache_size is not None else constants.PAGE_CACHE_SIZE
+        self._rendered_page = lru_cache(maxsize=self.cache_size)(self._render_page)
+
+    def __len__(self) -> int:
+        return len(self.page_plans)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[WhatsappPage, List[WhatsappPage]]:
+        if isinstance(idx, slice):
+            return [self._rendered_page(page_idx) for page_idx in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Page index {idx} out of range for a chat with {len(self)} pages')
+        return self._rendered_page(idx)
+
+    def __iter__(self) -> Iterator[WhatsappPage]:
+        return (self._rendered_page(idx) for idx in range(len(self)))
+
+    def get_page(self, page_number: int) -> WhatsappPage:
+        # Page numbers start at 1, like the saved page files
+        if page_number not in self._positions:
+            raise KeyError(f'Page {page_number} is not one of the pages of this chat')
+        return self._rendered_page(self._positions[page_number])
+
+    def cache_info(self):
+        return self._rendered_page.cache_info()
+
+    def clear_cache(self) -> None:
+        self._rendered_page.cache_clear()
+
+    @METRICS.timer('paged_chat.render')
+    def _render_page(self, idx: int) -> WhatsappPage:
+        page = self.page_builder(self.texts, self.page_plans[idx])
+        page.render_page()
+        return page
+
+    def __repr__(self) -> str:
+        return f'PagedChat ({len(self)} pages, {self.cache_info().currsize} rendered)'
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional
+
+from whatsapp_page.page_layout import PageJob
+
+
+class RenderManifest:
+    """
+    Record of what was rendered into an output directory: a hash of the render settings and assets,
+    plus one content hash per page job, used to skip pages whose content did not change.
+    """
+    FILE_NAME: str = 'manifest.json'
+    VERSION: int = 1
+
+    def __init__(self, settings_hash: str, page_hashes: Optional[Dict[int, str]] = None) -> None:
+        self.settings_hash = settings_hash
+        self.page_hashes: Dict[int, str] = page_hashes or {}
+
+    @staticmethod
+    def load(output_path: str) -> Optional['RenderManifest']:
+        file_name = os.path.join(output_path, RenderManifest.FILE_NAME)
+        try:
+            with open(file_name, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != RenderManifest.VERSION:
+            return None
+        page_hashes = {int(page_number): page_hash for page_number, page_hash in manifest['pages'].items()}
+        return RenderManifest(manifest['settings'], page_hashes)
+
+    def save(self, output_path: str) -> None:
+        os.makedirs(output_path, exist_ok=True)
+        file_name = os.path.join(output_path, RenderManifest.FILE_NAME)
+        manifest = {
+            'version': RenderManifest.VERSION,
+            'settings': self.settings_hash,
+            'pages': {str(page_number): page_hash for page_number, page_hash in sorted(self.page_hashes.items())},
+        }
+        # Write to a temporary file first so an interrupted run never leaves a truncated manifest behind
+        with open(file_name + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(file_name + '.tmp', file_name)
+
+    def is_current(self, page_number: int, page_hash: str) -> bool:
+        return self.page_hashes.get(page_number) == page_hash
+
+    @staticmethod
+    def hash_page_job(page_job: PageJob) -> str:
+        digest = hashlib.sha1()
+        for message, delivery_time, sender, consecutive_msg, text_size in page_job.records:
+            digest.update(repr((message, delivery_time.isoformat(), sender.name, sender.box_color, sender.align_right,
+                                consecutive_msg, tuple(text_size))).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_settings(settings: Dict[str, object], asset_paths: Iterable[str]) -> str:
+        digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        for asset_path in sorted(asset_paths):
+            with open(asset_path, 'rb') as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+        return digest.hexdigest()
@@ -0,0 +1,53 @@
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from PIL import Image, ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+import constants
+from instrumentation.metrics import METRICS
+from whatsapp_page.sprite_cache import SpriteCache
+
+
+class ResourceManager:
+    """
+    Per-process access to the fonts and images in the resources folder, each loaded on first use. Nothing is read
+    when the modules are imported, so the folder can still be changed with `configure` before anything is drawn.
+    """
+
+    def __init__(self, resources_path: Optional[str] = None) -> None:
+        self.resources_path = resources_path or constants.RESOURCES_PATH
+        self.get_font = lru_cache(maxsize=None)(self._load_font)
+        self.get_image_size = lru_cache(maxsize=None)(self._read_image_size)
+
+    def configure(self, resources_path: str) -> None:
+        self.resources_path = resources_path
+        self.clear()
+
+    def clear(self) -> None:
+        self.get_font.cache_clear()
+        self.get_image_size.cache_clear()
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.resources_path, name)
+
+    def get_image(self, name: str, mode: Optional[str] = None) -> Image:
+        # Decoded images are shared through the sprite cache, so callers must not draw on them
+        return SpriteCache.load(self.get_path(name), mode)
+
+    def _load_font(self, name: str, size: int) -> FreeTypeFont:
+        with METRICS.timer('resources.load_font'):
+            return ImageFont.truetype(self.get_path(name), size=size)
+
+    def _read_image_size(self, name: str) -> Tuple[int, int]:
+        # Opening an image only parses its header; the pixels are decoded by `get_image`
+        with Image.open(self.get_path(name)) as img:
+            return img.size
+
+    def __repr__(self) -> str:
+        return f'ResourceManager ({self.resources_path}, {self.get_font.cache_info().currsize} fonts)'
+
+
+RESOURCES = ResourceManager()
+METRICS.register_cache('resources.fonts', RESOURCES.get_font)
@@ -0,0 +1,33 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from instrumentation.metrics import METRICS
+
+
+class SpriteCache:
+    """
+    Per-process store of decoded, pre-converted static images. Cached sprites are shared between pages,
+    so callers must only read from them (paste sources, masks) or copy them before drawing.
+    """
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def load(file_name: str, mode: Optional[str] = None) -> Image:
+        img = Image.open(file_name)
+        if mode is not None and img.mode != mode:
+            return img.convert(mode)
+        img.load()
+        return img
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def rounded_plate(size: Tuple[int, int], color: Tuple[int, int, int], radius: int) -> Image:
+        plate = Image.new(size=size, mode='RGBA')
+        draw = ImageDraw.Draw(plate)
+        draw.rounded_rectangle((0, 0, size[0], size[1]), fill=color, radius=radius)
+        return plate
+
+
+METRICS.register_cache('sprite_cache.load', SpriteCache.load)
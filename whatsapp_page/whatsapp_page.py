@@ -1,32 +1,76 @@
-from copy import copy
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from PIL import Image
 
-import constants
+from whatsapp_page.output_format import OutputFormat
+from whatsapp_page.page_compositor import PageCompositor
+from whatsapp_page.resource_manager import RESOURCES
 
 
 class WhatsappPage:
     _PADDINGS: Tuple[int, int] = [10, 30]
-    _BACKGROUND_IMG_PATH: str = f'{constants.RESOURCES_PATH}/2224392.png'
-    _BACKGROUND_IMG: Image = Image.open(_BACKGROUND_IMG_PATH)
+    _BACKGROUND_IMG_NAME: str = '2224392.png'
     INIT_COORDINATES: Tuple[int, int] = 10, 20
-    PAGE_SIZE: Tuple[int, int] = _BACKGROUND_IMG.size
-    INNER_PAGE_WIDTH: int = PAGE_SIZE[0] - (_PADDINGS[0] * 2)
-    INNER_PAGE_HEIGHT: int = PAGE_SIZE[1] - (_PADDINGS[1] * 2)
 
-    def __init__(self, text_boxes: List['WhatsappPageElement']) -> None:
+    def __init__(self, text_boxes: List['WhatsappPageElement'], compositor: Optional[str] = None) -> None:
         self.text_boxes: List['WhatsappPageElement'] = text_boxes
-        self.img: Image = copy(WhatsappPage._BACKGROUND_IMG)
+        self.compositor = PageCompositor.get(compositor)
+        # The backend's pixel buffer while the page is being rendered
+        self.canvas = None
+        self.img: Optional[Image] = None
         self.rendered = False
 
+    @staticmethod
+    def preload() -> None:
+        WhatsappPage.get_background()
+
+    @staticmethod
+    def get_background() -> Image:
+        return RESOURCES.get_image(WhatsappPage._BACKGROUND_IMG_NAME)
+
+    @staticmethod
+    def get_page_size() -> Tuple[int, int]:
+        # The page is the size of its background, read from the image header without decoding it
+        return RESOURCES.get_image_size(WhatsappPage._BACKGROUND_IMG_NAME)
+
+    @staticmethod
+    def get_inner_page_width() -> int:
+        return WhatsappPage.get_page_size()[0] - (WhatsappPage._PADDINGS[0] * 2)
+
+    @staticmethod
+    def get_inner_page_height() -> int:
+        return WhatsappPage.get_page_size()[1] - (WhatsappPage._PADDINGS[1] * 2)
+
+    @staticmethod
+    def get_asset_paths() -> List[str]:
+        return [RESOURCES.get_path(WhatsappPage._BACKGROUND_IMG_NAME)]
+
+    @staticmethod
+    def get_render_settings() -> Dict[str, object]:
+        return {
+            'paddings': WhatsappPage._PADDINGS,
+            'init_coordinates': WhatsappPage.INIT_COORDINATES,
+            'page_size': WhatsappPage.get_page_size(),
+        }
+
     def render_page(self) -> Image:
+        if self.rendered:
+            return self.img
+        self.canvas = self.compositor.new_canvas(WhatsappPage.get_background())
         curr_offset = WhatsappPage.INIT_COORDINATES[1]
         for idx, text_box in enumerate(self.text_boxes):
             curr_offset = text_box.render_to_page(self, idx, curr_offset)
+        self.img = self.compositor.to_image(self.canvas)
+        self.canvas = None
         self.rendered = True
         return self.img
 
+    def paste(self, img: Image, xy: Tuple[int, int]) -> None:
+        self.compositor.paste(self.canvas, img, xy)
+
+    def draw_chat_box(self, chat_box: 'ChatBox', xy: Tuple[int, int]) -> None:
+        self.compositor.draw_chat_box(self.canvas, chat_box, xy)
+
     def show(self):
         if self.rendered:
             self.img.show()
@@ -36,8 +80,13 @@ class WhatsappPage:
     def get_chat_items(self) -> int:
         return sum(obj.get_type().value == 1 for obj in self.text_boxes)
 
-    def save(self, file_name):
-        if self.rendered:
-            self.img.save(file_name, format='png')
-        else:
-            self.render_page().save(file_name, format='png')
+    def get_image(self) -> Image:
+        return self.img if self.rendered else self.render_page()
+
+    def save(self, file_name, output_format: Optional[OutputFormat] = None):
+        output_format = output_format or OutputFormat.get()
+        output_format.save(self.get_image(), file_name)
+
+    def encode(self, output_format: Optional[OutputFormat] = None) -> bytes:
+        output_format = output_format or OutputFormat.get()
+        return output_format.encode(self.get_image())
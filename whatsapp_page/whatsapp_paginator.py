@@ -1,94 +1,272 @@
 import os
-from asyncio import Future
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from tqdm import tqdm
 
 import constants
+from models.chat_index import ChatIndex, ChatQuery
+from models.chat_store import ChatStore
+from instrumentation.metrics import METRICS
+from models.whatsapp_text import WhatsappText
 from whatsapp_page.elements.chat_box.chat_box import ChatBox
 from whatsapp_page.elements.date_label.date_label import DateLabel
 from whatsapp_page.elements.page_elements import WhatsappPageElement
+from whatsapp_page.page_layout import PageJob, PagePlan
+from whatsapp_page.paged_chat import PagedChat
+from whatsapp_page.output_format import OutputFormat
+from whatsapp_page.page_bundle import PageBundleWriter, PdfBundleWriter, SheetBundleWriter
+from whatsapp_page.page_renderer import PageRenderPool
+from whatsapp_page.render_manifest import RenderManifest
+from whatsapp_page.resource_manager import RESOURCES
 from whatsapp_page.whatsapp_page import WhatsappPage
 
-futures: List[Future] = []
 
+class WhatsappPaginator:
+    BUNDLE_TARGETS: Tuple[str, ...] = (PageJob.TARGET_PDF, PageJob.TARGET_SHEETS)
 
-def save_all(pages: List[WhatsappPage], offset: int) -> None:
-    global futures
-    with ThreadPoolExecutor() as executor:
-        for page_number, page in enumerate(pages):
-            futures.append(executor.submit(WhatsappPaginator.save_page, page, page_number + 1 + offset))
+    @staticmethod
+    def get_pages(all_texts: ChatStore, save: bool = False, workers: Optional[int] = None,
+                  max_in_flight: Optional[int] = None, incremental: bool = False,
+                  output_format: Optional[str] = None, bundle: Optional[str] = None,
+                  cache_size: Optional[int] = None, index: Optional[ChatIndex] = None,
+                  query: Optional[ChatQuery] = None, compositor: Optional[str] = None,
+                  tile_scale: Optional[float] = None) -> Optional[PagedChat]:
+        page_plans = WhatsappPaginator.plan_pages(all_texts)
+        page_count = len(page_plans)
+        # Indexes passed in or built here are saved next to the output; a reused one is already there
+        save_index = index is not None
+        if query is not None and index is None:
+            # The index is only needed to answer a query, so plain runs (and warm cache starts) skip it. One
+            # saved by an earlier run over the same export and layout is reused, pages included
+            index = ChatIndex.load(constants.OUTPUT_PATH, all_texts.source_key)
+            if index is None:
+                with METRICS.timer('build_index', log=True):
+                    index = ChatIndex.from_store(all_texts)
+                save_index = True
+        if index is not None:
+            index.set_pages(page_plans)
+        if query is not None:
+            # Only the pages holding a matching message (plus their context) are rendered
+            selected_pages = set(index.find_pages(query))
+            page_plans = [page_plan for page_plan in page_plans if page_plan.page_number in selected_pages]
+        if not save:
+            # Pages are rendered on access, keeping only the most recently used `cache_size` of them
+            return PagedChat(all_texts, page_plans, partial(WhatsappPaginator.build_page, compositor=compositor),
+                             cache_size)
 
+        save_path = constants.OUTPUT_PATH
+        output_format = OutputFormat.get(output_format)
+        if save_index:
+            index.save(save_path)
+        if bundle is not None:
+            if incremental:
+                raise ValueError('Incremental rendering keeps one file per page and cannot be used with a bundle')
+            WhatsappPaginator.save_bundle(all_texts, page_plans, bundle, output_format, workers, max_in_flight,
+                                          compositor, tile_scale)
+            return
 
-class WhatsappPaginator:
-    @staticmethod
-    def get_pages(all_texts: List[ChatBox], save: bool = False) -> Optional[List[WhatsappPage]]:
-        global futures
-        pages = []
-        remaining_texts = all_texts
-        total_texts = len(remaining_texts)
-        curr_page_number, offset = 0, 0
-        print('Getting pages...\n', flush=True)
-        progress_bar = tqdm(total=total_texts)
-        while remaining_texts:
-            new_page = WhatsappPaginator.split_page(remaining_texts)
-            curr_page_number += 1
-            progress_bar.update(new_page.get_chat_items())
-            pages.append(new_page)
-            if save and len(pages) == 100:
-                save_all(pages, offset)
-                offset += len(pages)
-                pages = []
-        if save and len(pages) > 0:
-            save_all(pages, offset)
-            offset += len(pages)
-            pages = []
+        settings_hash = RenderManifest.hash_settings(WhatsappPaginator.get_render_settings(output_format),
+                                                     WhatsappPaginator.get_asset_paths())
+        previous_manifest = RenderManifest.load(save_path) if incremental else None
+        if previous_manifest is not None and previous_manifest.settings_hash != settings_hash:
+            previous_manifest = None
+        # Pages left out by a query keep their entries, so a later incremental run can still skip them
+        manifest = RenderManifest(settings_hash, dict(previous_manifest.page_hashes) if previous_manifest else None)
+
+        progress_bar = tqdm(total=len(page_plans))
+        with PageRenderPool(WhatsappPaginator.render_job, initializer=WhatsappPaginator.get_worker_initializer(),
+                            workers=workers, max_in_flight=max_in_flight) as render_pool:
+            for page_plan in page_plans:
+                page_job = WhatsappPaginator.get_page_job(all_texts, page_plan, output_format,
+                                                          compositor=compositor)
+                page_hash = RenderManifest.hash_page_job(page_job)
+                manifest.page_hashes[page_plan.page_number] = page_hash
+                if previous_manifest is not None and previous_manifest.is_current(page_plan.page_number, page_hash) \
+                        and os.path.exists(WhatsappPaginator.get_page_file_name(page_plan.page_number, output_format)):
+                    progress_bar.update(1)
+                    continue
+                WhatsappPaginator._merge_worker_metrics(render_pool.submit(page_job), progress_bar)
+            WhatsappPaginator._merge_worker_metrics(render_pool.drain(), progress_bar)
         progress_bar.close()
-        if not save:
-            return pages
+
+        if previous_manifest is not None:
+            for page_number in previous_manifest.page_hashes:
+                if page_number <= page_count:
+                    continue
+                del manifest.page_hashes[page_number]
+                stale_file = WhatsappPaginator.get_page_file_name(page_number, output_format)
+                if os.path.exists(stale_file):
+                    os.remove(stale_file)
+        manifest.save(save_path)
+
+    @staticmethod
+    def save_bundle(all_texts: ChatStore, page_plans: List[PagePlan], bundle: str, output_format: OutputFormat,
+                    workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                    compositor: Optional[str] = None, tile_scale: Optional[float] = None) -> None:
+        tile_size = None
+        if bundle == PageJob.TARGET_PDF:
+            bundle_writer: PageBundleWriter = PdfBundleWriter(constants.OUTPUT_PATH)
+        elif bundle == PageJob.TARGET_SHEETS:
+            tile_size = SheetBundleWriter.get_tile_size(WhatsappPage.get_page_size(), tile_scale)
+            bundle_writer = SheetBundleWriter(constants.OUTPUT_PATH, tile_size, output_format)
         else:
-            print('Waiting for all jobs to complete...\n', flush=True)
-            for future in tqdm(futures):
-                future.result()
+            raise ValueError(f'Unknown bundle {bundle!r}, '
+                             f'expected one of {", ".join(WhatsappPaginator.BUNDLE_TARGETS)}')
+
+        # Workers encode the pages; the ordered pool returns them in page order so they are appended as they arrive
+        progress_bar = tqdm(total=len(page_plans))
+        render_pool = PageRenderPool(WhatsappPaginator.render_job,
+                                     initializer=WhatsappPaginator.get_worker_initializer(),
+                                     workers=workers, max_in_flight=max_in_flight, ordered=True)
+        with bundle_writer, render_pool:
+            for page_plan in page_plans:
+                page_job = WhatsappPaginator.get_page_job(all_texts, page_plan, output_format, bundle, tile_size,
+                                                          compositor)
+                WhatsappPaginator._merge_worker_metrics(render_pool.submit(page_job), progress_bar, bundle_writer)
+            WhatsappPaginator._merge_worker_metrics(render_pool.drain(), progress_bar, bundle_writer)
+        progress_bar.close()
 
     @staticmethod
-    def split_page(texts: List[ChatBox]) -> WhatsappPage:
-        page_texts: List[WhatsappPageElement] = []
+    def _merge_worker_metrics(completed: Iterable[Tuple[int, Dict, object]], progress_bar: tqdm,
+                              bundle_writer: Optional[PageBundleWriter] = None) -> None:
+        for page_number, worker_metrics, payload in completed:
+            METRICS.merge(worker_metrics)
+            if bundle_writer is not None:
+                with METRICS.timer('bundle_page'):
+                    bundle_writer.add_page(page_number, payload)
+                # Bundle writers count their bytes as they write their files
+                METRICS.increment('pages_written')
+            progress_bar.update(1)
 
-        curr_length = 0
+    @staticmethod
+    @METRICS.timer('plan_pages', log=True)
+    def plan_pages(texts: ChatStore) -> List[PagePlan]:
+        page_plans: List[PagePlan] = []
+        page_height = WhatsappPage.get_inner_page_height()
+        page_start, curr_length = 0, 0
         previous_date = None
-        previous_text: Optional[ChatBox] = None
-        while texts:
-            text_box = texts[0]
-            curr_length += text_box.get_approximate_size()[1] + \
-                           WhatsappPaginator.get_chat_margin(text_box, previous_text)
+        for idx in range(len(texts)):
+            text_height = ChatBox.get_approximate_height(texts.text_heights[idx])
+            curr_date = texts.get_day(idx)
+            same_sender = idx > page_start and texts.sender_ids[idx] == texts.sender_ids[idx - 1]
+            element_length = WhatsappPaginator.get_element_length(text_height, same_sender, curr_date != previous_date)
+            if curr_length + element_length > page_height and idx > page_start:
+                page_plans.append(PagePlan(len(page_plans) + 1, page_start, idx, curr_length))
+                page_start, curr_length = idx, 0
+                element_length = WhatsappPaginator.get_element_length(text_height, False, True)
+            curr_length += element_length
+            previous_date = curr_date
+
+        if page_start < len(texts):
+            page_plans.append(PagePlan(len(page_plans) + 1, page_start, len(texts), curr_length))
+        return page_plans
+
+    @staticmethod
+    def build_page(texts: ChatStore, page_plan: PagePlan, compositor: Optional[str] = None) -> WhatsappPage:
+        return WhatsappPaginator.assemble_page([ChatBox.from_store(texts, idx) for idx in page_plan.indices()],
+                                               compositor)
+
+    @staticmethod
+    def assemble_page(chat_boxes: List[ChatBox], compositor: Optional[str] = None) -> WhatsappPage:
+        page_texts: List[WhatsappPageElement] = []
+        previous_date = None
+        for text_box in chat_boxes:
             curr_date = text_box.text_msg.delivery_time.date()
             if curr_date != previous_date:
-                curr_length += DateLabel.LABEL_SIZE[1] + (DateLabel.LABEL_MARGIN * 2)
-            if curr_length > WhatsappPage.INNER_PAGE_HEIGHT:
-                break
-            texts.pop(0)
-            if curr_date != previous_date:
-                date_label = DateLabel(text_box.text_msg.delivery_time)
-                page_texts.append(date_label)
+                page_texts.append(DateLabel(text_box.text_msg.delivery_time))
             page_texts.append(text_box)
             previous_date = curr_date
-            previous_text = text_box
 
-        return WhatsappPage(page_texts)
+        return WhatsappPage(page_texts, compositor)
+
+    @staticmethod
+    def get_page_job(texts: ChatStore, page_plan: PagePlan, output_format: OutputFormat,
+                     target: str = PageJob.TARGET_FILE, tile_size: Optional[Tuple[int, int]] = None,
+                     compositor: Optional[str] = None) -> PageJob:
+        return PageJob(page_plan.page_number, [texts.get_record(idx) for idx in page_plan.indices()],
+                       output_format.name, target, tile_size, compositor)
+
+    @staticmethod
+    def get_worker_initializer() -> Callable[[], None]:
+        # Workers that are not forked import the modules afresh, so they are told the parent's resources folder
+        return partial(WhatsappPaginator.init_render_worker, RESOURCES.resources_path)
 
     @staticmethod
-    def save_page(new_page: WhatsappPage, page_number: int) -> None:
+    def init_render_worker(resources_path: Optional[str] = None) -> None:
+        # Workers may inherit the parent's numbers; start from zero so they are not reported twice
+        METRICS.reset()
+        if resources_path is not None:
+            RESOURCES.configure(resources_path)
+        # Load the fonts and decode the static sprites once per worker rather than on its first page
+        WhatsappPage.preload()
+        ChatBox.preload()
+        DateLabel.preload()
+
+    @staticmethod
+    def render_job(page_job: PageJob) -> Tuple[int, Dict, object]:
+        with METRICS.timer('render_job'):
+            payload = WhatsappPaginator._render_job(page_job)
+        # Workers report their own timings back with the result; the parent folds them into its report
+        return page_job.page_number, METRICS.snapshot(), payload
+
+    @staticmethod
+    def _render_job(page_job: PageJob) -> object:
+        texts = [ChatBox(WhatsappText(message=message, delivery_time=delivery_time, sender=sender),
+                         consecutive_msg, text_size)
+                 for message, delivery_time, sender, consecutive_msg, text_size in page_job.records]
+        new_page = WhatsappPaginator.assemble_page(texts, page_job.compositor)
+        output_format = OutputFormat.get(page_job.output_format)
+        if page_job.target == PageJob.TARGET_FILE:
+            WhatsappPaginator.save_page(new_page, page_job.page_number, output_format)
+            return None
+
+        with METRICS.timer('encode_page'):
+            if page_job.target == PageJob.TARGET_BYTES:
+                return new_page.encode(output_format)
+            if page_job.target == PageJob.TARGET_PDF:
+                return PdfBundleWriter.encode_page(new_page.get_image(), output_format)
+            return SheetBundleWriter.encode_tile(new_page.get_image(), page_job.tile_size)
+
+    @staticmethod
+    @METRICS.timer('save_page')
+    def save_page(new_page: WhatsappPage, page_number: int, output_format: Optional[OutputFormat] = None) -> None:
         save_path = constants.OUTPUT_PATH
         if not os.path.exists(save_path):
             os.makedirs(save_path, exist_ok=True)
 
-        file_name = os.path.join(save_path, f'{page_number}.png')
-        new_page.save(file_name)
+        output_format = output_format or OutputFormat.get()
+        file_name = WhatsappPaginator.get_page_file_name(page_number, output_format)
+        new_page.save(file_name, output_format)
+        METRICS.increment('pages_written')
+        METRICS.increment('bytes_written', os.path.getsize(file_name))
+
+    @staticmethod
+    def get_page_file_name(page_number: int, output_format: Optional[OutputFormat] = None) -> str:
+        output_format = output_format or OutputFormat.get()
+        return os.path.join(constants.OUTPUT_PATH, f'{page_number}.{output_format.extension}')
+
+    @staticmethod
+    def get_render_settings(output_format: OutputFormat) -> Dict[str, object]:
+        return {
+            'output_format': output_format.get_settings(),
+            'chat_box': ChatBox.get_render_settings(),
+            'date_label': DateLabel.get_render_settings(),
+            'page': WhatsappPage.get_render_settings(),
+            'max_element_height': WhatsappPageElement.MAX_ELEMENT_HEIGHT,
+        }
+
+    @staticmethod
+    def get_asset_paths() -> List[str]:
+        return ChatBox.get_asset_paths() + DateLabel.get_asset_paths() + WhatsappPage.get_asset_paths()
+
+    @staticmethod
+    def get_element_length(text_height: int, same_sender: bool, new_date: bool) -> int:
+        element_length = text_height + WhatsappPaginator.get_chat_margin(same_sender)
+        if new_date:
+            element_length += DateLabel.LABEL_SIZE[1] + (DateLabel.LABEL_MARGIN * 2)
+        return element_length
 
     @staticmethod
-    def get_chat_margin(text_box: ChatBox, previous_text: Optional[ChatBox]):
-        if previous_text is None or text_box.text_msg.sender != previous_text.text_msg.sender:
-            return ChatBox.MAX_MARGIN
-        return ChatBox.MIN_MARGIN
+    def get_chat_margin(same_sender: bool) -> int:
+        return ChatBox.MIN_MARGIN if same_sender else ChatBox.MAX_MARGIN